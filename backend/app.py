@@ -1,42 +1,231 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from models.optimizer import SmartPackagingOptimizer
-from utils.carbon_calculator import CarbonCalculator
+from typing import Dict, List, Optional
+from models.catalog import CatalogManager
+from database import versions
 from database.db import (
     insert_shipment,
     initialize_db,
     get_inventory,
     adjust_inventory,
-    get_shipments,
     create_reusable_package,
     scan_reusable_package,
     get_reusable_packages,
     update_package_condition,
+    SERIES_METRICS,
 )
+from database.storage import IntegrityError
+from database.archive import (
+    WEEK_FREQ,
+    archive_version,
+    current_week,
+    history_buckets,
+    history_time_range,
+    iter_history_series,
+    iter_shipment_history,
+    shipment_history,
+    shipment_summary,
+    weekly_box_counts,
+)
+from models.forecaster import METHODS as FORECAST_METHODS, forecast, reorder_report
+from models.simulator import simulate_catalog
+from models.rationalizer import OBJECTIVES as RATIONALIZE_OBJECTIVES, aggregate_demand, evaluate_catalog, rationalize
+import asyncio
+import hmac
+import math
+import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
 from datetime import timedelta
 import os
+import threading
+import time
 import uuid
+from utils import events, metrics, profiling
+from utils.downsampling import lttb
+from utils.idempotency import IdempotencyConflict, IdempotencyStore
+from utils.jobs import JobBusy, JobRunner
+from utils.responses import (
+    ROW_FORMATS,
+    CompressionMiddleware,
+    FastJSONResponse,
+    frame_columns,
+    frame_records,
+    rows_columns,
+)
 from dotenv import load_dotenv
 load_dotenv()
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+# gzip/br by Accept-Encoding; inside the metrics middleware so its cost is measured
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESS_MIN_BYTES", 1024)))
 
 # ensure database tables exist on startup
 @app.on_event("startup")
 def startup_event():
     initialize_db()
+    catalogs.start_watching()
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Per-endpoint latency and db call counts, exposed at /metrics.
+
+    Also honours the opt-in `X-Profile` header (see utils/profiling.py).
+    """
+    profiling.mark_request(request.headers.get("x-profile"))
+    token = metrics.begin_request()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Catalog-Version"] = catalogs.current.version
+        # set by the conditional() dependency on cacheable reads
+        tag = getattr(request.state, "etag", None)
+        if tag and status == 200:
+            response.headers["ETag"] = tag
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+    finally:
+        # label by route template, not raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        metrics.end_request(
+            token,
+            route=getattr(route, "path", "unmatched"),
+            method=request.method,
+            status=status,
+            elapsed=time.perf_counter() - start,
+        )
+
+
+def conditional(*domains, catalog=False, week=False):
+    """Route dependency for conditional GETs.
+
+    The ETag comes from the data-version counters of `domains` (plus the
+    catalog version, or the week in progress, when the response depends on
+    it), read before any data is.  A matching If-None-Match is answered with 304 before the endpoint
+    runs, so no query or report is computed.
+    """
+    def check(request: Request):
+        extra = [str(catalogs.current.version)] if catalog else []
+        if week:
+            extra.append(current_week().date().isoformat())
+        tag = versions.etag(*domains, extra="-".join(extra) or None)
+        if versions.matches(request.headers.get("if-none-match"), tag):
+            metrics.inc("http_not_modified_total", route=request.scope["route"].path)
+            raise HTTPException(status_code=304, headers={"ETag": tag, "Cache-Control": "no-cache"})
+        request.state.etag = tag
+    return Depends(check)
+
+
+metrics.describe("http_not_modified_total", "Conditional GETs answered with 304.")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Expose collected metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Guard for admin endpoints; profiling is off unless PROFILER_TOKEN is set."""
+    if not profiling.enabled():
+        raise HTTPException(status_code=404, detail="profiling disabled")
+    if not profiling.check_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="invalid admin token")
+
+
+def require_job_admin(x_admin_token: str = Header(None)):
+    """Guard for batch jobs; off unless ADMIN_TOKEN (or PROFILER_TOKEN) is set."""
+    token = os.getenv("ADMIN_TOKEN") or os.getenv("PROFILER_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="admin endpoints disabled")
+    if not (x_admin_token and hmac.compare_digest(token, x_admin_token)):
+        raise HTTPException(status_code=403, detail="invalid admin token")
+
+
+def submit_job(runner, fn):
+    """Start `fn` on `runner`; 202 with the job, or 409 naming the running one."""
+    try:
+        job = runner.submit(fn)
+    except JobBusy as e:
+        raise HTTPException(status_code=409, detail={"error": f"a {runner.kind} job is already running",
+                                                     "job_id": e.job_id})
+    return FastJSONResponse(job, status_code=202)
+
+
+def job_status(runner, job_id):
+    job = runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return job
+
+
+@app.post("/admin/profile/start", dependencies=[Depends(require_admin)])
+def profile_start(mode: str = "cprofile", requests: int = 10, seconds: float = 0,
+                  allocations: bool = False):
+    """Arm a capture for the next N requests or for a time window."""
+    try:
+        return profiling.start(mode=mode, requests=requests, seconds=seconds,
+                               allocations=allocations)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/admin/profile/stop", dependencies=[Depends(require_admin)])
+def profile_stop():
+    """End the current capture early, keeping what it collected."""
+    return profiling.stop()
+
+
+@app.get("/admin/profile/status", dependencies=[Depends(require_admin)])
+def profile_status():
+    return profiling.status()
+
+
+@app.get("/admin/profile/download", dependencies=[Depends(require_admin)])
+def profile_download():
+    """Download the last capture as a pstats or collapsed-stack file."""
+    exported = profiling.export()
+    if exported is None:
+        raise HTTPException(status_code=404, detail="no profile captured")
+    data, filename, media_type = exported
+    return Response(
+        content=data,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/admin/profile/allocations", dependencies=[Depends(require_admin)])
+def profile_allocations():
+    """Per-request tracemalloc summaries from the last capture."""
+    return {"allocations": profiling.allocations()}
 
 import os
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(BASE_DIR)
 
-boxes_path = os.path.join(PROJECT_ROOT, "data", "boxes.csv")
-carbon_path = os.path.join(PROJECT_ROOT, "data", "material_carbon_data.csv")
+# the box catalog is hot-reloaded when the files under data/ change; each
+# request reads `catalogs.current` once and works on that snapshot
+catalogs = CatalogManager(os.path.join(PROJECT_ROOT, "data"))
+catalogs.add_listener(lambda old, new: metrics.inc("catalog_reloads_total"))
+metrics.describe("catalog_reloads_total", "Box catalog hot reloads.")
+metrics.register_gauge("catalog_loaded_timestamp_seconds", lambda: catalogs.current.loaded_at)
+
+
+@app.get("/catalog")
+def catalog_info():
+    """Report the active catalog version."""
+    catalog = catalogs.current
+    return {
+        "catalog_version": catalog.version,
+        "loaded_at": catalog.loaded_at,
+        "source": catalog.source,
+        "boxes": len(catalog),
+    }
 
-optimizer = SmartPackagingOptimizer(boxes_path)
-carbon_calc = CarbonCalculator(carbon_path)
 
 class Product(BaseModel):
     length: float
@@ -44,41 +233,77 @@ class Product(BaseModel):
     height: float
     weight: float
     fragile: bool = False
+    category: Optional[str] = None
+    # box selection: waste (default), cost, co2 or a weighted blend
+    objective: str = "waste"
+    blend: Optional[Dict[str, float]] = None
+    pareto: bool = False
+
+
+# recent Idempotency-Key values and their /optimize responses
+idempotency = IdempotencyStore(
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_KEYS", 10000)),
+    ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600)),
+    wait_timeout=float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 5)),
+)
 
 
 @app.post("/optimize")
-def optimize_packaging(product: Product):
-
-    result = optimizer.optimize(
-        product_length=product.length,
-        product_width=product.width,
-        product_height=product.height,
-        weight=product.weight,
-        fragile=product.fragile
-    )
+@profiling.profiled
+def optimize_packaging(product: Product, response: Response,
+                       idempotency_key: Optional[str] = Header(None)):
+    """Select a box, record the shipment and take the box out of stock.
+
+    Retries that carry the same `Idempotency-Key` header are coalesced:
+    one computation and one database write, with concurrent duplicates
+    waiting for and sharing the first response.
+    """
+    if not idempotency_key:
+        return _optimize_and_record(product)
+    try:
+        body, replayed = idempotency.run(
+            idempotency_key, product.model_dump_json(), lambda: _optimize_and_record(product)
+        )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+    except TimeoutError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return body
+
+
+def _optimize_and_record(product: Product):
+
+    catalog = catalogs.current
+    with metrics.timed("optimizer"):
+        try:
+            result = catalog.optimizer.optimize(
+                product_length=product.length,
+                product_width=product.width,
+                product_height=product.height,
+                weight=product.weight,
+                fragile=product.fragile,
+                objective=product.objective,
+                blend=product.blend,
+                pareto=product.pareto,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     if "error" in result:
         return result
 
-    optimized_volume = (
-        result["box_dimensions"][0] *
-        result["box_dimensions"][1] *
-        result["box_dimensions"][2]
-    )
-
-    default_volume = optimized_volume * 1.5
-
-    carbon_result = carbon_calc.calculate(
-        optimized_box={"cost_per_box": 25},
-        default_box_volume=default_volume,
-        optimized_box_volume=optimized_volume
-    )
+    # savings are measured against the category's default box when known
+    with metrics.timed("carbon_calc"):
+        carbon_result = catalog.carbon_calc.analyze(result, category=product.category)
 
     shipment_data = {
         "product_length": product.length,
         "product_width": product.width,
         "product_height": product.height,
         "weight": product.weight,
+        "fragile": product.fragile,
         "selected_box": result["selected_box"],
         "waste_percentage": result["waste_percentage"],
         "co2_saved": carbon_result["co2_saved_kg"],
@@ -86,82 +311,298 @@ def optimize_packaging(product: Product):
         "sustainability_score": carbon_result["sustainability_score"]
     }
 
-    insert_shipment(shipment_data)
+    with metrics.timed("insert_shipment"):
+        insert_shipment(shipment_data)
 
     # update inventory: reduce stock by 1 and record usage
-    adjust_inventory(result["selected_box"], change=-1, record_use=True)
+    with metrics.timed("adjust_inventory"):
+        adjust_inventory(result["selected_box"], change=-1, record_use=True)
 
     return {
         "optimization": result,
-        "carbon_analysis": carbon_result
+        "carbon_analysis": carbon_result,
+        "catalog_version": catalog.version,
     }
 
-@app.get("/inventory")
+class BoxSpec(BaseModel):
+    box_id: str
+    length_cm: float
+    width_cm: float
+    height_cm: float
+    max_weight_kg: float
+    material_type: str = "cardboard"
+    cost_per_box: float
+
+
+class SimulationRequest(BaseModel):
+    boxes: List[BoxSpec]
+    chunk_size: int = 200000
+    workers: int = 0
+
+
+simulations = JobRunner("simulation")
+
+
+@app.post("/simulate", dependencies=[Depends(require_job_admin)])
+def simulate(request: SimulationRequest):
+    """Replay shipment history against a candidate catalog (read-only).
+
+    Runs in the background: responds 202 with a job id to poll at
+    `/simulate/{job_id}`, or 409 while another simulation runs.  The report
+    compares aggregate empty volume, box cost and box CO2 for the candidate
+    with the boxes actually used. Nothing is written to the database.
+    """
+    if not request.boxes:
+        raise HTTPException(status_code=400, detail="candidate catalog is empty")
+    catalog = catalogs.current
+    candidate = pd.DataFrame([b.model_dump() for b in request.boxes])
+
+    def run():
+        with metrics.timed("simulation"):
+            report = simulate_catalog(
+                candidate,
+                catalog.boxes,
+                catalog.carbon_calc.co2_factors,
+                iter_shipment_history(chunk_size=max(1000, request.chunk_size)),
+                workers=max(0, min(request.workers, os.cpu_count() or 1)),
+            )
+        report["catalog_version"] = catalog.version
+        return report
+
+    return submit_job(simulations, run)
+
+
+@app.get("/simulate/{job_id}", dependencies=[Depends(require_job_admin)])
+def simulation_status(job_id: str):
+    """Status of a simulation job; `result` holds the report once done."""
+    return job_status(simulations, job_id)
+
+
+class RationalizeRequest(BaseModel):
+    k: int
+    objective: str = "volume"
+    boxes: Optional[List[BoxSpec]] = None
+    time_budget_seconds: float = 60.0
+    workers: int = 0
+    resolution_cm: float = 1.0
+
+
+rationalizations = JobRunner("rationalization")
+
+
+@app.post("/catalog/rationalize", dependencies=[Depends(require_job_admin)])
+def rationalize_catalog(request: RationalizeRequest):
+    """Pick the K box sizes that minimise waste or cost over shipment history.
+
+    Runs in the background like /simulate: 202 with a job id to poll at
+    `/catalog/rationalize/{job_id}`, 409 while another run is going.
+    Candidates default to the active catalog. The report also scores the
+    active catalog on the same history for comparison.
+    """
+    if request.objective not in RATIONALIZE_OBJECTIVES:
+        raise HTTPException(status_code=400, detail=f"objective must be one of {RATIONALIZE_OBJECTIVES}")
+    if request.k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1")
+    catalog = catalogs.current
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(request.workers or cpus, cpus))
+
+    def run():
+        candidates = (pd.DataFrame([b.model_dump() for b in request.boxes]) if request.boxes
+                      else catalog.boxes)
+        with metrics.timed("rationalize"):
+            demand = aggregate_demand(iter_shipment_history(), resolution=max(0.1, request.resolution_cm))
+            if demand.empty:
+                return {"error": "insufficient data"}
+            report = rationalize(
+                demand,
+                candidates,
+                request.k,
+                objective=request.objective,
+                time_budget=max(1.0, min(request.time_budget_seconds, 600.0)),
+                workers=workers,
+            )
+            report["current_catalog"] = evaluate_catalog(demand, catalog.boxes, request.objective)
+        report["catalog_version"] = catalog.version
+        return report
+
+    return submit_job(rationalizations, run)
+
+
+@app.get("/catalog/rationalize/{job_id}", dependencies=[Depends(require_job_admin)])
+def rationalization_status(job_id: str):
+    """Status of a rationalization job; `result` holds the report once done."""
+    return job_status(rationalizations, job_id)
+
+
+@app.get("/inventory", dependencies=[conditional("inventory")])
+@profiling.profiled
 def inventory_list():
     """Return current inventory status."""
     return {"inventory": get_inventory()}
 
-@app.get("/forecast")
-def demand_forecast(weeks: int = 8):
-    """Predict next week's box demand using simple linear regression on weekly counts."""
-    rows = get_shipments()
-    df = pd.DataFrame(rows)
-    if df.empty or "created_at" not in df.columns:
-        return {"error": "insufficient data"}
+# forecasts are computed once per data version and week in progress: weekly
+# counts scan the whole history, so they are shared by every parameter
+# combination, and the set of complete weeks only moves when a week ends
+FORECAST_SEASON_WEEKS = int(os.getenv("FORECAST_SEASON_WEEKS", 4))
+REORDER_LEAD_WEEKS = int(os.getenv("REORDER_LEAD_WEEKS", 2))
+REORDER_REVIEW_WEEKS = int(os.getenv("REORDER_REVIEW_WEEKS", 1))
+REORDER_SERVICE_LEVEL = float(os.getenv("REORDER_SERVICE_LEVEL", 0.95))
+_forecasts = {"version": None, "weekly": None, "results": {}}
+_forecasts_lock = threading.Lock()
 
-    df["created_at"] = pd.to_datetime(df["created_at"])
-    # group by week start (Monday)
-    weekly = df.groupby([pd.Grouper(key="created_at", freq="W-MON"), "selected_box"]).size().unstack(fill_value=0)
-    overall = weekly.sum(axis=1).reset_index(name="count")
-    overall["week_num"] = range(len(overall))
-
-    # train on all weeks
-    X = overall[["week_num"]]
-    y = overall["count"]
-    model = LinearRegression()
-    model.fit(X, y)
-    next_week_num = [[len(overall)]]
-    next_overall = int(model.predict(next_week_num)[0])
-
-    # by box
-    box_preds = {}
-    for box in weekly.columns:
-        series = weekly[box].reset_index(name="count")
-        series["week_num"] = range(len(series))
-        if len(series) >= 2:
-            m = LinearRegression().fit(series[["week_num"]], series["count"])
-            box_preds[box] = int(m.predict([[len(series)]])[0])
+
+def _weekly_forecast(horizon, method, level):
+    """(complete weekly counts, forecast) for the current data and week.
+
+    Fits on every week before the one in progress, with weeks without
+    shipments counted as zero, so the forecast starts at the current week.
+    """
+    # read before the data, so a concurrent write can only make the entry older than its key
+    current = current_week()
+    version = (versions.current("shipments"), archive_version(), current)
+    key = (horizon, method, level)
+    with _forecasts_lock:
+        if _forecasts["version"] == version:
+            weekly = _forecasts["weekly"]
+            result = _forecasts["results"].get(key)
         else:
-            box_preds[box] = int(series["count"].iloc[-1] if not series.empty else 0)
+            weekly = result = None
+    metrics.record_cache("forecast", result is not None)
+    if result is not None:
+        return weekly, result
+    if weekly is None:
+        weekly = weekly_box_counts()
+        # the week in progress would read as a collapse in demand, so it is
+        # forecast instead; quiet weeks up to it count as zero
+        if not weekly.empty:
+            weeks = pd.date_range(weekly.index[0], current - timedelta(days=7), freq=WEEK_FREQ)
+            weekly = weekly.reindex(weeks, fill_value=0)
+    result = forecast(weekly, horizon, method, level, FORECAST_SEASON_WEEKS) if not weekly.empty else None
+    with _forecasts_lock:
+        if _forecasts["version"] != version:
+            _forecasts.update(version=version, weekly=weekly, results={})
+        if len(_forecasts["results"]) >= 32:
+            _forecasts["results"].clear()
+        _forecasts["results"][key] = result
+    return weekly, result
+
+
+def _check_forecast_params(method, level):
+    if method != "auto" and method not in FORECAST_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be auto or one of {FORECAST_METHODS}")
+    if not 0 < level < 1:
+        raise HTTPException(status_code=400, detail="level must be between 0 and 1")
+
+
+def _rounded(values):
+    return [round(float(v), 2) for v in values]
+
+
+@app.get("/forecast", dependencies=[conditional("shipments", week=True)])
+@profiling.profiled
+def demand_forecast(weeks: int = 8, method: str = "auto", level: float = 0.8):
+    """Forecast weekly box demand `weeks` ahead with `level` prediction intervals.
+
+    `method` is seasonal_naive, ses, linear or auto (best per box on recent
+    weeks).  Forecasts start at the week in progress; `history` holds the
+    complete weeks before it.
+    `overall_next_week`, `by_box` and `history` keep their old meaning;
+    `boxes` and `overall` carry the full horizon.
+    """
+    _check_forecast_params(method, level)
+    weeks = max(1, min(weeks, 52))
+    weekly, result = _weekly_forecast(weeks, method, level)
+    if result is None:
+        return {"error": "insufficient data"}
 
-    history = overall["count"].tolist()
-    return {"overall_next_week": next_overall, "by_box": box_preds, "history": history}
+    overall = result["overall"]
+    boxes = {
+        str(box): {
+            "method": result["method"][i],
+            "mean": _rounded(result["mean"][:, i]),
+            "lower": _rounded(result["lower"][:, i]),
+            "upper": _rounded(result["upper"][:, i]),
+        }
+        for i, box in enumerate(result["boxes"])
+    }
+    return {
+        "overall_next_week": int(overall["mean"][0]),
+        "by_box": {str(box): int(result["mean"][0, i]) for i, box in enumerate(result["boxes"])},
+        "history": weekly.sum(axis=1).tolist(),
+        "history_weeks": [w.date().isoformat() for w in weekly.index],
+        "weeks": [w.date().isoformat() for w in result["weeks"]],
+        "level": level,
+        "overall": {name: _rounded(overall[name]) for name in ("mean", "lower", "upper")},
+        "boxes": boxes,
+    }
+
+
+@app.get("/forecast/reorder", dependencies=[conditional("shipments", "inventory", week=True)])
+@profiling.profiled
+def reorder_points(lead_weeks: int = REORDER_LEAD_WEEKS, review_weeks: int = REORDER_REVIEW_WEEKS,
+                   service_level: float = REORDER_SERVICE_LEVEL, method: str = "auto"):
+    """Reorder points and order quantities per box from the forecast and current stock.
 
-@app.get("/storage")
-def storage_report():
-    """Generate storage optimization report based on current inventory."""
+    A box needs ordering when stock is at or below forecast demand over
+    `lead_weeks` plus safety stock for `service_level`; the quantity tops it
+    up to cover `lead_weeks + review_weeks`.
+    """
+    _check_forecast_params(method, service_level)
+    if lead_weeks < 1 or review_weeks < 0 or lead_weeks + review_weeks > 52:
+        raise HTTPException(status_code=400, detail="need lead_weeks >= 1, review_weeks >= 0, total <= 52")
+    # the forecast of the default horizon is reused when it is long enough
+    _, result = _weekly_forecast(max(8, lead_weeks + review_weeks), method, 0.8)
+    if result is None:
+        return {"error": "insufficient data"}
+    rows = reorder_report(result, get_inventory(), lead_weeks, review_weeks, service_level)
+    return {
+        "lead_weeks": lead_weeks,
+        "review_weeks": review_weeks,
+        "service_level": service_level,
+        "to_order": sum(1 for row in rows if row["reorder"]),
+        "boxes": rows,
+    }
+
+
+def _check_format(format):
+    if format not in ROW_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {ROW_FORMATS}")
+
+
+@app.get("/storage", dependencies=[conditional("inventory", catalog=True)])
+@profiling.profiled
+def storage_report(format: str = "records"):
+    """Generate storage optimization report based on current inventory.
+
+    `format=columns` returns the table as column arrays.
+    """
+    _check_format(format)
+    catalog = catalogs.current
     inv = get_inventory()
     if not inv:
-        return {"storage": [], "total_area": 0}
+        return {"storage": [], "total_area": 0, "catalog_version": catalog.version}
     df_inv = pd.DataFrame(inv)
-    # load box dimensions
-    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    boxes_path = os.path.join(base, "data", "boxes.csv")
-    boxes = pd.read_csv(boxes_path)
-    df = df_inv.merge(boxes, left_on="box_size", right_on="box_id", how="left")
+    # box dimensions come from the active catalog snapshot
+    dims = catalog.lookup(df_inv["box_size"], ("length_cm", "width_cm"))
+    df = df_inv.merge(dims, left_on="box_size", right_on="box_id", how="left")
     # compute footprint (area) per unit
     df["area_per_box"] = df["length_cm"] * df["width_cm"]
     df["total_area"] = df["area_per_box"] * df["stock"]
     df["inefficiency"] = df["stock"] - df["usage_count"]
-    total_area = df["total_area"].sum()
-    result = df["box_size stock usage_count area_per_box total_area inefficiency".split()].to_dict(orient="records")
-    return {"storage": result, "total_area": total_area}
+    total_area = float(df["total_area"].sum())
+    table = df["box_size stock usage_count area_per_box total_area inefficiency".split()]
+    result = frame_columns(table) if format == "columns" else frame_records(table)
+    return FastJSONResponse({"storage": result, "total_area": total_area, "catalog_version": catalog.version})
 
 @app.post("/reusable/create")
 def create_reusable(box_size: str):
     """Generate a new reusable package with unique QR ID."""
     qr_id = str(uuid.uuid4())
-    create_reusable_package(qr_id, box_size)
+    try:
+        create_reusable_package(qr_id, box_size)
+    except IntegrityError:
+        raise HTTPException(status_code=422, detail=f"unknown box size: {box_size}")
     return {"qr_id": qr_id, "box_size": box_size}
 
 
@@ -172,14 +613,17 @@ def scan_package(qr_id: str):
     return {"status": "scanned", "qr_id": qr_id}
 
 
-@app.get("/reusable/list")
-def list_reusable():
+@app.get("/reusable/list", dependencies=[conditional("packages")])
+@profiling.profiled
+def list_reusable(format: str = "records"):
     """Get all reusable packages with reuse history.
 
     The database column was renamed to `package_condition` to avoid using a
     reserved word. For backwards compatibility the JSON payload returns a
     `condition` field so the frontend doesn't need to change.
+    `format=columns` returns column arrays instead of row objects.
     """
+    _check_format(format)
     packages = get_reusable_packages()
     # normalize keys for frontend convenience
     normalized = []
@@ -187,10 +631,13 @@ def list_reusable():
         if "package_condition" in p:
             p["condition"] = p.pop("package_condition")
         normalized.append(p)
-    return {"packages": normalized}
+    if format == "columns":
+        normalized = rows_columns(normalized)
+    return FastJSONResponse({"packages": normalized})
 
 
-@app.get("/reuse-score")
+@app.get("/reuse-score", dependencies=[conditional("packages")])
+@profiling.profiled
 def reuse_score():
     """Calculate store sustainability rating based on reuse."""
     packages = get_reusable_packages()
@@ -229,12 +676,119 @@ def update_condition(data: PackageCondition):
 
 
 
+# /shipments returns this many of the latest rows unless asked for fewer or more
+SHIPMENTS_LIMIT = int(os.getenv("SHIPMENTS_LIMIT", 1000))
+SHIPMENTS_MAX_LIMIT = 10000
+
+
 # simple helper endpoint to fetch historical shipments for analytics
-@app.get("/shipments")
-def list_shipments():
-    """Return all recorded shipments for analytics/dashboard."""
-    rows = get_shipments()
-    return {"shipments": rows}
+@app.get("/shipments", dependencies=[conditional("shipments")])
+@profiling.profiled
+def list_shipments(format: str = "records", limit: int = SHIPMENTS_LIMIT):
+    """Return the latest `limit` shipments (archived and hot), oldest first.
+
+    `format=columns` returns column arrays instead of row objects, which is
+    smaller on the wire and loads straight into a DataFrame.  Totals over
+    the whole history are at /shipments/summary.
+    """
+    _check_format(format)
+    rows = shipment_history(limit=max(1, min(limit, SHIPMENTS_MAX_LIMIT)))
+    if format == "columns":
+        rows = rows_columns(rows)
+    return FastJSONResponse({"shipments": rows})
+
+
+@app.get("/shipments/summary", dependencies=[conditional("shipments")])
+@profiling.profiled
+def shipments_summary():
+    """Shipment count, metric totals and per-box counts over the whole history."""
+    return FastJSONResponse(shipment_summary())
+
+
+@app.get("/shipments/series", dependencies=[conditional("shipments")])
+@profiling.profiled
+def shipment_series(metric: str = "co2_saved", points: int = 500, method: str = "lttb",
+                    agg: str = "sum"):
+    """Return one shipment metric over time, reduced to at most `points`.
+
+    `method=bucket` aggregates fixed time buckets (in the database for hot rows) (`agg` is
+    sum or avg); `method=lttb` keeps the visually significant raw points.
+    """
+    if metric not in SERIES_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {SERIES_METRICS}")
+    if method not in ("lttb", "bucket") or agg not in ("sum", "avg"):
+        raise HTTPException(status_code=400, detail="method must be lttb|bucket, agg sum|avg")
+    points = max(3, min(points, 10000))
+
+    first, last, total = history_time_range()
+    if not total:
+        return {"metric": metric, "method": method, "total_points": 0, "series": []}
+
+    if method == "bucket":
+        span = (pd.Timestamp(last) - pd.Timestamp(first)).total_seconds()
+        # buckets are aligned to the epoch, not to `first`, so the range can
+        # straddle one more bucket than span / size; size for points - 1
+        bucket_seconds = max(1, math.ceil(span / (points - 1))) if span else 1
+        rows = history_buckets(metric, bucket_seconds)
+        series = [
+            {"created_at": bucket, metric: (total_ if agg == "sum" else avg), "count": count}
+            for bucket, total_, avg, count in rows
+        ]
+        return {"metric": metric, "method": method, "bucket_seconds": bucket_seconds,
+                "total_points": total, "series": series}
+
+    # reduce each archive month as it is read, then the whole series
+    created, values = [], []
+    for stamps, chunk in iter_history_series(metric):
+        stamps = pd.DatetimeIndex(stamps)
+        keep = lttb(stamps.asi8, chunk, points)
+        created.append(stamps[keep])
+        values.append(chunk[keep])
+    created = created[0].append(created[1:])
+    values = np.concatenate(values).tolist()
+    keep = lttb(created.asi8, values, points)
+    series = [{"created_at": created[i].isoformat(), metric: values[i]} for i in keep]
+    return {"metric": metric, "method": method, "total_points": total, "series": series}
+
+# idle connections get a comment this often, keeping proxies from closing them
+EVENTS_HEARTBEAT_SECONDS = 15
+
+
+@app.get("/events")
+async def event_stream(request: Request, last_event_id: Optional[str] = Header(None)):
+    """Server-sent events: shipment, stock and package changes as they happen.
+
+    Event types: `shipment` (a recorded shipment), `stock` (box_size,
+    change, used), `package` (created/scanned/condition), `invalidate`
+    (domains changed by another worker; refetch them) and `resync` (events
+    were lost; refetch everything).  Reconnecting clients send
+    `Last-Event-ID` and receive what they missed.
+    """
+    broker = events.get_broker()
+    subscriber = broker.subscribe(last_event_id)
+
+    async def stream():
+        try:
+            # sent at once so the client sees the stream open
+            yield b"retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                chunk = b"".join(events.format_sse(*event) for event in broker.drain(subscriber))
+                if chunk:
+                    yield chunk
+        finally:
+            broker.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @app.post("/inventory/update")
 def inventory_update(box_size: str, change: int):
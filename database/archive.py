@@ -0,0 +1,497 @@
+# database/archive.py
+
+"""Hot/cold tiering for the shipments table.
+
+Shipments older than the retention window are copied to compressed
+Parquet files partitioned by month, then deleted from the hot table, so
+the table (and every write and index on it) stays small.  Weekly rollups
+per box are kept next to the archive for forecasting and analytics.
+
+Layout under `ARCHIVE_DIR` (default data/archive)::
+
+    shipments/month=2025-01/part-<run>-<first id>-<last id>.parquet
+    rollups/weekly.parquet
+
+A run commits by rewriting the rollups, whose file metadata also holds the
+archive's high-water mark: the largest archived id and the run's `before`
+cutoff.  Rows under the mark (id <= max id and created_at < before) belong
+to the archive, all others to the hot table, so no reader counts a row
+twice.  A run that dies before its commit leaves files the mark does not
+cover yet; one that dies after it leaves hot rows that readers skip and
+the next run deletes.  The id alone is not enough because `initialize_db`
+recreates the hot table and restarts ids, but rows created after a restart
+are newer than every earlier cutoff.  Rows a rerun copies again are dropped
+as duplicates by (id, created_at).
+
+Readers never load the whole archive: counts and time ranges come from the
+rollups and the Parquet footers, and rows are read one month at a time.
+
+Usage::
+
+    python -m database.archive [--older-than-days 90]
+"""
+
+import argparse
+import os
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import metrics
+from database.db import (
+    delete_shipments,
+    get_shipment_buckets,
+    get_shipment_series,
+    get_shipment_time_range,
+    iter_shipments,
+)
+from database.storage import SERIES_METRICS, SHIPMENT_COLUMNS, SHIPMENT_REPLAY_COLUMNS
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DIR = os.path.join(PROJECT_ROOT, "data", "archive")
+DEFAULT_RETENTION_DAYS = 90
+
+# the weeks /forecast groups by
+WEEK_FREQ = "W-MON"
+WEEK_SECONDS = 7 * 24 * 3600
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("product_length", pa.float64()),
+    ("product_width", pa.float64()),
+    ("product_height", pa.float64()),
+    ("weight", pa.float64()),
+    ("fragile", pa.bool_()),
+    ("selected_box", pa.string()),
+    ("waste_percentage", pa.float64()),
+    ("co2_saved", pa.float64()),
+    ("cost_saved", pa.float64()),
+    ("sustainability_score", pa.float64()),
+    ("created_at", pa.timestamp("us")),
+])
+
+ROLLUP_COLUMNS = ("month", "week", "selected_box", "shipments") + tuple(
+    f"{metric}_sum" for metric in SERIES_METRICS
+)
+
+_KEY = ["id", "created_at"]
+# rollup file metadata holding the high-water mark
+_MARK_ID = b"archived_max_id"
+_MARK_BEFORE = b"archived_before"
+
+
+def current_week(now=None):
+    """Label of the week in progress, as weekly_box_counts labels weeks.
+
+    W-MON weeks run Tuesday to Monday and are labelled by their Monday.
+    """
+    day = (pd.Timestamp.now() if now is None else pd.Timestamp(now)).normalize()
+    return day + pd.Timedelta(days=(0 - day.weekday()) % 7)
+
+
+def archive_dir():
+    return os.getenv("ARCHIVE_DIR") or DEFAULT_DIR
+
+
+def _rollups_path(directory):
+    return os.path.join(directory, "rollups", "weekly.parquet")
+
+
+def _months(directory, start=None, end=None):
+    """Month partitions, oldest first; only those overlapping [start, end] if given."""
+    folder = os.path.join(directory, "shipments")
+    if not os.path.isdir(folder):
+        return []
+    months = sorted(
+        name.split("=", 1)[1] for name in os.listdir(folder) if name.startswith("month=")
+    )
+    if start is not None:
+        months = [m for m in months if m >= start.strftime("%Y-%m")]
+    if end is not None:
+        months = [m for m in months if m <= end.strftime("%Y-%m")]
+    return months
+
+
+def _month_files(directory, month):
+    folder = os.path.join(directory, "shipments", f"month={month}")
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.endswith(".parquet") and not name.startswith("."))
+
+
+def archive_version(directory=None):
+    """Changes whenever an archive run commits; None if there is no archive."""
+    try:
+        return os.stat(_rollups_path(directory or archive_dir())).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def high_water_mark(directory=None):
+    """(max id, before) of the committed archive, or None.
+
+    None both before the first commit and for archives written before the
+    mark existed; the latter are read unfiltered.
+    """
+    try:
+        metadata = pq.read_schema(_rollups_path(directory or archive_dir())).metadata or {}
+    except FileNotFoundError:
+        return None
+    if _MARK_ID not in metadata:
+        return None
+    return int(metadata[_MARK_ID]), datetime.fromisoformat(metadata[_MARK_BEFORE].decode())
+
+
+def _empty(columns):
+    return pd.DataFrame({name: pd.Series(dtype=SCHEMA.field(name).type.to_pandas_dtype())
+                         for name in columns})
+
+
+def _read_month(directory, month, columns, mark):
+    """One month partition, limited to rows under `mark` and without duplicates."""
+    wanted = list(dict.fromkeys(list(columns) + _KEY))
+    filters = None
+    if mark is not None:
+        filters = [("id", "<=", mark[0]), ("created_at", "<", pd.Timestamp(mark[1]))]
+    table = pq.read_table(os.path.join(directory, "shipments", f"month={month}"),
+                          columns=wanted, schema=SCHEMA, filters=filters)
+    frame = table.to_pandas().drop_duplicates(subset=_KEY)
+    return frame[list(columns)]
+
+
+def _committed_months(directory, start=None, end=None):
+    """(months, mark) readers should use; no months before the first commit."""
+    if archive_version(directory) is None:
+        return [], None
+    return _months(directory, start, end), high_water_mark(directory)
+
+
+def _write_atomic(table, path):
+    # dot-prefixed temp files are skipped by Parquet dataset readers
+    folder, name = os.path.split(path)
+    os.makedirs(folder, exist_ok=True)
+    tmp = os.path.join(folder, f".{name}.tmp")
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+
+
+def read_archive(columns=SHIPMENT_COLUMNS, start=None, end=None, directory=None):
+    """Archived shipments created in [start, end), ordered by month.
+
+    Only the month partitions overlapping the window are read.
+    """
+    directory = directory or archive_dir()
+    columns = list(columns)
+    months, mark = _committed_months(directory, start, end)
+    frames = []
+    for month in months:
+        frame = _read_month(directory, month, list(dict.fromkeys(columns + ["created_at"])), mark)
+        if start is not None:
+            frame = frame[frame["created_at"] >= pd.Timestamp(start)]
+        if end is not None:
+            frame = frame[frame["created_at"] < pd.Timestamp(end)]
+        frames.append(frame[columns])
+    return pd.concat(frames, ignore_index=True) if frames else _empty(columns)
+
+
+def read_rollups(directory=None):
+    """Weekly per-box rollups of everything archived."""
+    path = _rollups_path(directory or archive_dir())
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=list(ROLLUP_COLUMNS))
+    return pq.read_table(path).to_pandas()
+
+
+def _rollup_month(directory, month, mark):
+    data = _read_month(directory, month, ["id", "created_at", "selected_box", *SERIES_METRICS], mark)
+    grouped = data.groupby([pd.Grouper(key="created_at", freq=WEEK_FREQ), "selected_box"])
+    rollup = grouped.agg(
+        shipments=("id", "size"),
+        **{f"{metric}_sum": (metric, "sum") for metric in SERIES_METRICS},
+    ).reset_index().rename(columns={"created_at": "week"})
+    rollup.insert(0, "month", month)
+    return rollup[rollup["shipments"] > 0]
+
+
+def _commit(directory, months, mark):
+    """Rebuild the rollups of `months` and store `mark` with them in one write."""
+    # rollups are recomputed from the archived rows of each touched month,
+    # so reruns after a failure never double count
+    existing = read_rollups(directory)
+    existing = existing[~existing["month"].isin(months)]
+    rollups = pd.concat([existing] + [_rollup_month(directory, m, mark) for m in sorted(months)],
+                        ignore_index=True)
+    rollups = rollups.sort_values(["week", "selected_box", "month"], kind="stable")
+    table = pa.Table.from_pandas(rollups[list(ROLLUP_COLUMNS)], preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        _MARK_ID: str(mark[0]).encode(),
+        _MARK_BEFORE: mark[1].isoformat().encode(),
+    })
+    _write_atomic(table, _rollups_path(directory))
+
+
+def archive_shipments(before, chunk_size=100000, directory=None):
+    """Move shipments created before `before` from the hot table to the archive."""
+    directory = directory or archive_dir()
+    run = time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    start = time.perf_counter()
+    previous = high_water_mark(directory)
+    months = set()
+    archived = 0
+    max_id = previous[0] if previous else 0
+
+    # rows under the previous mark are archived already; they are only
+    # still here if that run died before deleting them
+    for rows in iter_shipments(columns=SHIPMENT_COLUMNS, chunk_size=chunk_size, before=before,
+                               archived=previous):
+        frame = pd.DataFrame.from_records(rows, columns=SHIPMENT_COLUMNS)
+        frame["fragile"] = frame["fragile"].astype(bool)
+        frame["created_at"] = pd.to_datetime(frame["created_at"])
+        for month, part in frame.groupby(frame["created_at"].dt.strftime("%Y-%m"), sort=False):
+            name = f"part-{run}-{part['id'].iloc[0]}-{part['id'].iloc[-1]}.parquet"
+            table = pa.Table.from_pandas(part, schema=SCHEMA, preserve_index=False)
+            _write_atomic(table, os.path.join(directory, "shipments", f"month={month}", name))
+            months.add(month)
+        archived += len(frame)
+        max_id = max(max_id, int(frame["id"].max()))
+
+    mark = previous
+    if archived:
+        mark = (max_id, max(before, previous[1]) if previous else before)
+        _commit(directory, months, mark)
+        metrics.inc("archive_rows_total", archived)
+    # only after every row is committed to the archive
+    deleted = delete_shipments(*mark) if mark else 0
+    return {
+        "before": before.isoformat(),
+        "archived": archived,
+        "deleted": deleted,
+        "months": sorted(months),
+        "elapsed_seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def _hot_rows(columns, chunk_size=100000, mark=None):
+    for chunk in iter_shipments(columns=columns, chunk_size=chunk_size, archived=mark):
+        yield from chunk
+
+
+def shipment_history(limit=None):
+    """The latest `limit` shipments (all if None) across both tiers, oldest first.
+
+    Rows are dicts shaped like get_shipments().  The hot table is streamed
+    and archive months are read newest first until `limit` rows are found.
+    """
+    directory = archive_dir()
+    months, mark = _committed_months(directory)
+    hot = deque((dict(zip(SHIPMENT_COLUMNS, row)) for row in _hot_rows(SHIPMENT_COLUMNS, mark=mark)),
+                maxlen=limit)
+    frames = []
+    missing = None if limit is None else limit - len(hot)
+    for month in reversed(months):
+        if missing is not None and missing <= 0:
+            break
+        frame = _read_month(directory, month, SHIPMENT_COLUMNS, mark)
+        frame = frame.sort_values(["created_at", "id"], kind="stable")
+        if missing is not None:
+            frame = frame.tail(missing)
+            missing -= len(frame)
+        frames.insert(0, frame)
+    rows = []
+    for frame in frames:
+        frame = frame.astype({"fragile": int})
+        for row in frame.to_dict(orient="records"):
+            row["created_at"] = row["created_at"].to_pydatetime()
+            rows.append(row)
+    return rows + list(hot)
+
+
+def iter_shipment_history(columns=SHIPMENT_REPLAY_COLUMNS, chunk_size=100000):
+    """Like `iter_shipments`, over the archive first and then the hot table."""
+    directory = archive_dir()
+    months, mark = _committed_months(directory)
+    for month in months:
+        part = _read_month(directory, month, columns, mark)
+        if "fragile" in columns:
+            part = part.astype({"fragile": int})
+        rows = list(part.itertuples(index=False, name=None))
+        for i in range(0, len(rows), chunk_size):
+            yield rows[i:i + chunk_size]
+    yield from iter_shipments(columns=columns, chunk_size=chunk_size, archived=mark)
+
+
+def _hot_weekly(columns, mark):
+    """Hot rows grouped by week and box: shipments and the sums of `columns`."""
+    frames = []
+    for chunk in iter_shipments(columns=("created_at", "selected_box", *columns), archived=mark):
+        frame = pd.DataFrame(chunk, columns=["created_at", "selected_box", *columns])
+        frame["created_at"] = pd.to_datetime(frame["created_at"])
+        frames.append(
+            frame.groupby([pd.Grouper(key="created_at", freq=WEEK_FREQ), "selected_box"])
+            .agg(shipments=("selected_box", "size"),
+                 **{f"{c}_sum": (c, "sum") for c in columns})
+            .reset_index().rename(columns={"created_at": "week"})
+        )
+    return frames
+
+
+def weekly_box_counts():
+    """Shipments per week and box over the whole history.
+
+    Archived weeks come from the rollups, recent ones from the hot table.
+    Returns a DataFrame indexed by week (W-MON, gaps filled with 0) with
+    one column per box.
+    """
+    directory = archive_dir()
+    rollups = read_rollups(directory)[["week", "selected_box", "shipments"]]
+    hot = _hot_weekly((), high_water_mark(directory))
+    counts = pd.concat([rollups, *hot], ignore_index=True)
+    if counts.empty:
+        return pd.DataFrame()
+    counts["week"] = pd.to_datetime(counts["week"])
+    weekly = counts.groupby(["week", "selected_box"])["shipments"].sum().unstack(fill_value=0)
+    weeks = pd.date_range(weekly.index.min(), weekly.index.max(), freq=WEEK_FREQ)
+    return weekly.reindex(weeks, fill_value=0).astype(int)
+
+
+def shipment_summary():
+    """Totals over both tiers for dashboards.
+
+    Returns the shipment count, the sum of every series metric and the
+    count per box.  Archived rows are counted from the rollups.
+    """
+    directory = archive_dir()
+    frames = [read_rollups(directory)]
+    frames += _hot_weekly(SERIES_METRICS, high_water_mark(directory))
+    data = pd.concat(frames, ignore_index=True)
+    boxes = data.groupby("selected_box")["shipments"].sum() if len(data) else pd.Series(dtype=int)
+    return {
+        "shipments": int(data["shipments"].sum()),
+        "totals": {m: float(data[f"{m}_sum"].sum()) for m in SERIES_METRICS},
+        "by_box": {str(box): int(n) for box, n in boxes.items()},
+    }
+
+
+def _archive_bounds(directory):
+    """(first, last) created_at over the archive files, from their footers."""
+    column = SCHEMA.get_field_index("created_at")
+    low = high = None
+    for month in _months(directory):
+        for path in _month_files(directory, month):
+            metadata = pq.ParquetFile(path).metadata
+            for i in range(metadata.num_row_groups):
+                stats = metadata.row_group(i).column(column).statistics
+                if stats is None or not stats.has_min_max:
+                    continue
+                low = stats.min if low is None else min(low, stats.min)
+                high = stats.max if high is None else max(high, stats.max)
+    return (low, high) if low is not None else None
+
+
+def history_time_range():
+    """(first created_at, last created_at, row count) across both tiers."""
+    directory = archive_dir()
+    mark = high_water_mark(directory)
+    first, last, total = get_shipment_time_range(archived=mark)
+    # files a run left before its commit hold rows that are still hot, so
+    # their timestamps are inside the history either way
+    bounds = _archive_bounds(directory) if archive_version(directory) is not None else None
+    if bounds is None:
+        return first, last, total
+    stamps = [t for t in (first, last, *bounds) if t is not None]
+    archived = int(read_rollups(directory)["shipments"].sum())
+    return min(stamps), max(stamps), total + archived
+
+
+def iter_history_series(metric):
+    """(created_at, values) arrays for one metric, oldest first.
+
+    One pair per archive month, then one for the hot table, so callers
+    can reduce each before the next is read.
+    """
+    directory = archive_dir()
+    months, mark = _committed_months(directory)
+    for month in months:
+        part = _read_month(directory, month, ["created_at", metric], mark)
+        part = part.sort_values("created_at", kind="stable")
+        yield part["created_at"].to_numpy(), part[metric].to_numpy(dtype=float)
+    rows = get_shipment_series(metric, archived=mark)
+    yield (pd.to_datetime([r[0] for r in rows]).to_numpy(),
+           np.array([r[1] for r in rows], dtype=np.float64))
+
+
+def history_buckets(metric, bucket_seconds):
+    """Like `get_shipment_buckets`, with archived rows bucketed here.
+
+    Buckets of a week or more take archived rows from the weekly rollups,
+    each week counted in the bucket its first day (or the first archived
+    row, if later) falls in; finer buckets read the archive a month at a
+    time.  Every tier floors naive timestamps from the epoch, so the same
+    bucket gets the same start whichever tier its rows are in.
+    """
+    directory = archive_dir()
+    months, mark = _committed_months(directory)
+    hot = pd.DataFrame(get_shipment_buckets(metric, bucket_seconds, archived=mark),
+                       columns=["bucket", "sum", "avg", "count"])
+    cold = []
+    if months and bucket_seconds >= WEEK_SECONDS:
+        rollups = read_rollups(directory)
+        # a week is labelled by its last day; bucket it by its first, but
+        # not before the oldest archived row so no bucket precedes the range
+        starts = pd.to_datetime(rollups["week"]).dt.to_period(WEEK_FREQ).dt.start_time
+        bounds = _archive_bounds(directory)
+        if bounds is not None:
+            starts = starts.clip(lower=pd.Timestamp(bounds[0]))
+        cold.append(pd.DataFrame({
+            "bucket": _bucket(starts, bucket_seconds),
+            "sum": rollups[f"{metric}_sum"].astype(float),
+            "count": rollups["shipments"].astype(int),
+        }))
+    else:
+        for month in months:
+            part = _read_month(directory, month, ["created_at", metric], mark)
+            cold.append(
+                part.assign(bucket=_bucket(part["created_at"], bucket_seconds))
+                .groupby("bucket")[metric].agg(["sum", "count"]).reset_index()
+            )
+    if not cold:
+        return list(hot.itertuples(index=False, name=None))
+    hot["bucket"] = pd.to_datetime(hot["bucket"])
+    merged = pd.concat(cold + [hot[["bucket", "sum", "count"]]]).groupby("bucket").sum()
+    merged = merged[merged["count"] > 0]
+    return [
+        (bucket.to_pydatetime(), float(row["sum"]), float(row["sum"]) / row["count"], int(row["count"]))
+        for bucket, row in merged.iterrows()
+    ]
+
+
+def _bucket(stamps, bucket_seconds):
+    # fixed-size buckets from the epoch, as the databases compute them
+    return pd.to_datetime(stamps).dt.floor(pd.Timedelta(seconds=bucket_seconds))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old shipments to Parquet.")
+    parser.add_argument("--older-than-days", type=float,
+                        default=float(os.getenv("SHIPMENT_RETENTION_DAYS", DEFAULT_RETENTION_DAYS)))
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--dir", help="archive directory (default: ARCHIVE_DIR or data/archive)")
+    args = parser.parse_args(argv)
+
+    before = datetime.now() - timedelta(days=args.older_than_days)
+    report = archive_shipments(before, chunk_size=args.chunk_size, directory=args.dir)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+metrics.describe("archive_rows_total", "Shipment rows moved to the Parquet archive.")
+
+
+if __name__ == "__main__":
+    main()
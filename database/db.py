@@ -1,205 +1,150 @@
-import os
-import mysql.connector
+"""Database access used by the API, CLI and tools.
 
-def get_connection():
-    return mysql.connector.connect(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        database=os.getenv("DB_NAME"),
-        port=int(os.getenv("DB_PORT", 3306))
-    )
+Every function delegates to the storage backend chosen by `DB_BACKEND`
+(see database/storage.py): `mysql` (default) or `sqlite`.  Writes bump
+the data versions in database/versions.py that read endpoints turn into
+ETags, and publish change events for live dashboards (utils/events.py).
+"""
 
-def initialize_db():
-    """Create required tables if they do not exist."""
-    conn = get_connection()
-    cur = conn.cursor()
-    
-    # Create shipments table with proper schema
-    try:
-        cur.execute("DROP TABLE IF EXISTS shipments")
-    except mysql.connector.Error:
-        pass
-    
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS shipments (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        product_length FLOAT NOT NULL,
-        product_width FLOAT NOT NULL,
-        product_height FLOAT NOT NULL,
-        weight FLOAT NOT NULL,
-        selected_box VARCHAR(255) NOT NULL,
-        waste_percentage FLOAT NOT NULL,
-        co2_saved FLOAT NOT NULL,
-        cost_saved FLOAT NOT NULL,
-        sustainability_score FLOAT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    
-    # create inventory table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS inventory (
-        box_size VARCHAR(255) PRIMARY KEY,
-        stock INT DEFAULT 0,
-        usage_count INT DEFAULT 0
-    )
-    """)
-    
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS reusable_packages (
-        qr_id VARCHAR(255) PRIMARY KEY,
-        box_size VARCHAR(255),
-        reuse_count INT DEFAULT 0,
-        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_used_date TIMESTAMP DEFAULT NULL,
-        package_condition VARCHAR(50) DEFAULT 'excellent',
-        FOREIGN KEY (box_size) REFERENCES inventory(box_size)
-    )
-    """)
-    
-    # if the table existed previously with a column named `condition`,
-    # attempt to rename it so future operations work without quoting.
-    try:
-        cur.execute("""
-            ALTER TABLE reusable_packages
-            CHANGE COLUMN `condition` package_condition VARCHAR(50) DEFAULT 'excellent'
-        """)
-    except mysql.connector.Error:
-        # ignore errors (either column doesn't exist or already renamed)
-        pass
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+from datetime import datetime
 
-def insert_shipment(data):
+from utils import events, metrics
+from database import versions
+from database.storage import SERIES_METRICS, SHIPMENT_COLUMNS, SHIPMENT_REPLAY_COLUMNS, get_backend
+
+# shipment fields carried by "shipment" events
+_SHIPMENT_EVENT_FIELDS = (
+    "product_length", "product_width", "product_height", "weight", "selected_box",
+    "waste_percentage", "co2_saved", "cost_saved", "sustainability_score",
+)
 
-    connection = get_connection()
-    cursor = connection.cursor()
+def get_connection():
+    """Raw MySQL connection for test_db.py and ad-hoc scripts.
 
-    query = """
-    INSERT INTO shipments
-    (product_length, product_width, product_height, weight,
-     selected_box, waste_percentage, co2_saved,
-     cost_saved, sustainability_score)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    Imported on use so the SQLite backend works without mysql-connector.
     """
+    from database.mysql_backend import get_connection as connect
+    return connect()
 
-    values = (
-        data["product_length"],
-        data["product_width"],
-        data["product_height"],
-        data["weight"],
-        data["selected_box"],
-        data["waste_percentage"],
-        data["co2_saved"],
-        data["cost_saved"],
-        data["sustainability_score"]
-    )
 
-    cursor.execute(query, values)
-    connection.commit()
+@metrics.instrument_db
+def initialize_db():
+    """Create required tables if they do not exist."""
+    backend = get_backend()
+    backend.initialize()
+    backend.changed(*versions.DOMAINS)
+    events.publish("resync", {})
 
-    cursor.close()
-    connection.close()
+@metrics.instrument_db
+def insert_shipment(data):
+    backend = get_backend()
+    backend.insert_shipment(data)
+    backend.changed("shipments")
+    events.publish("shipment", {
+        **{key: data[key] for key in _SHIPMENT_EVENT_FIELDS},
+        "fragile": bool(data.get("fragile", False)),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    })
 
 
+@metrics.instrument_db
 def get_inventory():
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute("SELECT box_size, stock, usage_count FROM inventory")
-    rows = cursor.fetchall()
-    cursor.close()
-    connection.close()
-    return rows
+    return get_backend().get_inventory()
 
 
+@metrics.instrument_db
 def adjust_inventory(box_size: str, change: int = 0, record_use: bool = False):
     """Update inventory stock by change and optionally increment usage_count."""
-    connection = get_connection()
-    cursor = connection.cursor()
-
-    # ensure the row exists
-    cursor.execute(
-        "INSERT INTO inventory (box_size, stock, usage_count) VALUES (%s, %s, %s) "
-        "ON DUPLICATE KEY UPDATE stock = stock, usage_count = usage_count",
-        (box_size, 0, 0)
-    )
-
-    if change != 0:
-        cursor.execute(
-            "UPDATE inventory SET stock = stock + %s WHERE box_size = %s",
-            (change, box_size)
-        )
-    if record_use:
-        cursor.execute(
-            "UPDATE inventory SET usage_count = usage_count + 1 WHERE box_size = %s",
-            (box_size,)
-        )
-
-    connection.commit()
-    cursor.close()
-    connection.close()
+    backend = get_backend()
+    backend.adjust_inventory(box_size, change, record_use)
+    backend.changed("inventory")
+    events.publish("stock", {"box_size": box_size, "change": change, "used": bool(record_use)})
 
 
+@metrics.instrument_db
 def get_shipments():
     """Return all shipment rows as list of dicts."""
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM shipments")
-    rows = cursor.fetchall()
-    cursor.close()
-    connection.close()
-    return rows
+    return get_backend().get_shipments()
+
+
+def iter_shipments(columns=SHIPMENT_REPLAY_COLUMNS, chunk_size=100000, before=None, archived=None):
+    """Stream shipment rows as lists of tuples, `chunk_size` rows at a time.
+
+    Rows come in id order, optionally only those created before `before`
+    and not `archived` (see database/storage.py).
+    The full history is never held in memory.  Not wrapped by
+    instrument_db: a generator would only time its creation.
+    """
+    unknown = set(columns) - set(SHIPMENT_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown columns: {sorted(unknown)}")
+    for rows in get_backend().iter_shipments(columns, chunk_size, before, archived):
+        metrics.inc("db_rows_streamed_total", len(rows), function="iter_shipments")
+        yield rows
+
+
+@metrics.instrument_db
+def delete_shipments(max_id: int, before):
+    """Delete shipments with id <= max_id created before `before` (archival)."""
+    backend = get_backend()
+    deleted = backend.delete_shipments(max_id, before)
+    backend.changed("shipments")
+    return deleted
+
+
+@metrics.instrument_db
+def get_shipment_series(metric: str, archived=None):
+    """Return (created_at, value) rows for one metric, oldest first."""
+    if metric not in SERIES_METRICS:
+        raise ValueError(f"unknown metric: {metric}")
+    return get_backend().get_shipment_series(metric, archived)
+
+
+@metrics.instrument_db
+def get_shipment_buckets(metric: str, bucket_seconds: int, archived=None):
+    """Aggregate one metric into fixed time buckets inside the database.
+
+    Returns rows of (bucket_start, sum, avg, count), oldest first.
+    """
+    if metric not in SERIES_METRICS:
+        raise ValueError(f"unknown metric: {metric}")
+    return get_backend().get_shipment_buckets(metric, bucket_seconds, archived)
+
+
+@metrics.instrument_db
+def get_shipment_time_range(archived=None):
+    """Return (first created_at, last created_at, row count)."""
+    return get_backend().get_shipment_time_range(archived)
 
 
+@metrics.instrument_db
 def create_reusable_package(qr_id: str, box_size: str):
     """Create a new reusable package with QR ID."""
-    connection = get_connection()
-    cursor = connection.cursor()
-    cursor.execute(
-        "INSERT INTO reusable_packages (qr_id, box_size) VALUES (%s, %s)",
-        (qr_id, box_size)
-    )
-    connection.commit()
-    cursor.close()
-    connection.close()
+    backend = get_backend()
+    backend.create_reusable_package(qr_id, box_size)
+    backend.changed("packages")
+    events.publish("package", {"action": "created", "qr_id": qr_id, "box_size": box_size})
 
 
+@metrics.instrument_db
 def scan_reusable_package(qr_id: str):
     """Record a reuse event for a package."""
-    connection = get_connection()
-    cursor = connection.cursor()
-    cursor.execute(
-        "UPDATE reusable_packages SET reuse_count = reuse_count + 1, "
-        "last_used_date = CURRENT_TIMESTAMP WHERE qr_id = %s",
-        (qr_id,)
-    )
-    connection.commit()
-    cursor.close()
-    connection.close()
+    backend = get_backend()
+    backend.scan_reusable_package(qr_id)
+    backend.changed("packages")
+    events.publish("package", {"action": "scanned", "qr_id": qr_id})
 
 
+@metrics.instrument_db
 def get_reusable_packages():
     """Return all reusable packages."""
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM reusable_packages ORDER BY created_date DESC")
-    rows = cursor.fetchall()
-    cursor.close()
-    connection.close()
-    return rows
+    return get_backend().get_reusable_packages()
 
 
+@metrics.instrument_db
 def update_package_condition(qr_id: str, condition: str):
     """Update package condition (excellent/good/fair/damaged)."""
-    connection = get_connection()
-    cursor = connection.cursor()
-    cursor.execute(
-        "UPDATE reusable_packages SET package_condition = %s WHERE qr_id = %s",
-        (condition, qr_id)
-    )
-    connection.commit()
-    cursor.close()
-    connection.close()
+    backend = get_backend()
+    backend.update_package_condition(qr_id, condition)
+    backend.changed("packages")
+    events.publish("package", {"action": "condition", "qr_id": qr_id, "condition": condition})
@@ -0,0 +1,420 @@
+# database/mysql_backend.py
+
+import os
+import struct
+import threading
+import time
+import mysql.connector
+from utils import metrics
+from database import versions
+from database.storage import IntegrityError, StorageBackend
+
+
+def get_connection():
+    metrics.inc("db_connections_opened_total")
+    return mysql.connector.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME"),
+        port=int(os.getenv("DB_PORT", 3306))
+    )
+
+
+def _where(before=None, archived=None):
+    """WHERE clause and parameters for the shipment filters."""
+    clauses, params = [], []
+    if before is not None:
+        clauses.append("created_at < %s")
+        params.append(before)
+    if archived is not None:
+        clauses.append("(id > %s OR created_at >= %s)")
+        params += list(archived)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
+
+
+def _bump(cursor, *domains):
+    """Bump data versions inside the caller's transaction."""
+    cursor.execute(
+        "UPDATE data_versions SET version = version + 1 "
+        f"WHERE domain IN ({', '.join(['%s'] * len(domains))})",
+        domains
+    )
+
+
+class _TableCounters:
+    """Data versions in the `data_versions` table.
+
+    Every host using the database sees the same counters, because each
+    write bumps them in its own transaction.  Reads come from a process-local
+    copy of all the counters, refreshed over one persistent connection at
+    most every `DATA_VERSION_TTL_SECONDS` (default 1), so conditional GETs
+    do not query MySQL.  Other hosts' writes show up within that interval;
+    this process's own writes drop the copy at once.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("DATA_VERSION_TTL_SECONDS", 1))
+        self._lock = threading.Lock()
+        self._connection = None
+        self._values = None
+        self._expires = 0.0
+
+    @property
+    def epoch(self):
+        return self._snapshot().get("epoch", 0)
+
+    def _snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            hit = self._values is not None and now < self._expires
+            metrics.record_cache("data_versions", hit)
+            if not hit:
+                self._values = self._select()
+                self._expires = now + self.ttl
+            return self._values
+
+    def _select(self):
+        try:
+            if self._connection is None:
+                self._connection = get_connection()
+                # a snapshot transaction would keep returning the same versions
+                self._connection.autocommit = True
+            cursor = self._connection.cursor()
+            cursor.execute("SELECT domain, version FROM data_versions")
+            rows = cursor.fetchall()
+            cursor.close()
+        except mysql.connector.Error:
+            # the next read reconnects
+            connection, self._connection = self._connection, None
+            if connection is not None:
+                try:
+                    connection.close()
+                except mysql.connector.Error:
+                    pass
+            raise
+        return {domain: int(version) for domain, version in rows}
+
+    def invalidate(self):
+        with self._lock:
+            self._values = None
+
+    def read(self, indexes):
+        values = self._snapshot()
+        return tuple(values.get(versions.DOMAINS[i], 0) for i in indexes)
+
+    def bump(self, indexes):
+        connection = get_connection()
+        cursor = connection.cursor()
+        _bump(cursor, *(versions.DOMAINS[i] for i in indexes))
+        connection.commit()
+        cursor.close()
+        connection.close()
+        self.invalidate()
+
+
+class MySQLBackend(StorageBackend):
+    """MySQL server configured by DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT."""
+
+    name = "mysql"
+
+    def __init__(self):
+        self._counters = None
+
+    def version_counters(self):
+        self._counters = _TableCounters()
+        return self._counters
+
+    def changed(self, *domains):
+        # the write already bumped the table in its transaction
+        if self._counters is not None:
+            self._counters.invalidate()
+        versions.bumped(*domains)
+
+    def initialize(self):
+        conn = get_connection()
+        cur = conn.cursor()
+
+        # Create shipments table with proper schema
+        try:
+            cur.execute("DROP TABLE IF EXISTS shipments")
+        except mysql.connector.Error:
+            pass
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS shipments (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            product_length FLOAT NOT NULL,
+            product_width FLOAT NOT NULL,
+            product_height FLOAT NOT NULL,
+            weight FLOAT NOT NULL,
+            fragile BOOLEAN NOT NULL DEFAULT FALSE,
+            selected_box VARCHAR(255) NOT NULL,
+            waste_percentage FLOAT NOT NULL,
+            co2_saved FLOAT NOT NULL,
+            cost_saved FLOAT NOT NULL,
+            sustainability_score FLOAT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_shipments_created_at (created_at)
+        )
+        """)
+
+        # create inventory table
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS inventory (
+            box_size VARCHAR(255) PRIMARY KEY,
+            stock INT DEFAULT 0,
+            usage_count INT DEFAULT 0
+        )
+        """)
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS reusable_packages (
+            qr_id VARCHAR(255) PRIMARY KEY,
+            box_size VARCHAR(255),
+            reuse_count INT DEFAULT 0,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_date TIMESTAMP DEFAULT NULL,
+            package_condition VARCHAR(50) DEFAULT 'excellent',
+            FOREIGN KEY (box_size) REFERENCES inventory(box_size)
+        )
+        """)
+
+        # if the table existed previously with a column named `condition`,
+        # attempt to rename it so future operations work without quoting.
+        try:
+            cur.execute("""
+                ALTER TABLE reusable_packages
+                CHANGE COLUMN `condition` package_condition VARCHAR(50) DEFAULT 'excellent'
+            """)
+        except mysql.connector.Error:
+            # ignore errors (either column doesn't exist or already renamed)
+            pass
+
+        # data versions for ETags, shared by every host using this database;
+        # the epoch is drawn once, when the table is first filled
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            domain VARCHAR(32) PRIMARY KEY,
+            version BIGINT UNSIGNED NOT NULL DEFAULT 0
+        )
+        """)
+        epoch = struct.unpack("<Q", os.urandom(8))[0]
+        cur.executemany(
+            "INSERT IGNORE INTO data_versions (domain, version) VALUES (%s, %s)",
+            [("epoch", epoch)] + [(domain, 0) for domain in versions.DOMAINS]
+        )
+        _bump(cur, *versions.DOMAINS)
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+    def insert_shipment(self, data):
+
+        connection = get_connection()
+        cursor = connection.cursor()
+
+        query = """
+        INSERT INTO shipments
+        (product_length, product_width, product_height, weight, fragile,
+         selected_box, waste_percentage, co2_saved,
+         cost_saved, sustainability_score)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+
+        values = (
+            data["product_length"],
+            data["product_width"],
+            data["product_height"],
+            data["weight"],
+            bool(data.get("fragile", False)),
+            data["selected_box"],
+            data["waste_percentage"],
+            data["co2_saved"],
+            data["cost_saved"],
+            data["sustainability_score"]
+        )
+
+        cursor.execute(query, values)
+        _bump(cursor, "shipments")
+        connection.commit()
+
+        cursor.close()
+        connection.close()
+
+    def get_inventory(self):
+        connection = get_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT box_size, stock, usage_count FROM inventory")
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+        return rows
+
+    def adjust_inventory(self, box_size, change=0, record_use=False):
+        connection = get_connection()
+        cursor = connection.cursor()
+
+        # ensure the row exists
+        cursor.execute(
+            "INSERT INTO inventory (box_size, stock, usage_count) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE stock = stock, usage_count = usage_count",
+            (box_size, 0, 0)
+        )
+
+        if change != 0:
+            cursor.execute(
+                "UPDATE inventory SET stock = stock + %s WHERE box_size = %s",
+                (change, box_size)
+            )
+        if record_use:
+            cursor.execute(
+                "UPDATE inventory SET usage_count = usage_count + 1 WHERE box_size = %s",
+                (box_size,)
+            )
+
+        _bump(cursor, "inventory")
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+    def get_shipments(self):
+        connection = get_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM shipments")
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+        return rows
+
+    def iter_shipments(self, columns, chunk_size, before=None, archived=None):
+        # unbuffered cursor so the full history is never held in memory
+        connection = get_connection()
+        cursor = connection.cursor(buffered=False)
+        try:
+            where, params = _where(before, archived)
+            cursor.execute(f"SELECT {', '.join(columns)} FROM shipments{where} ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                # abandoned mid-stream: unread rows are discarded with the connection
+                pass
+            connection.close()
+
+    def delete_shipments(self, max_id, before):
+        connection = get_connection()
+        cursor = connection.cursor()
+        deleted = 0
+        # small batches keep each transaction and its locks short
+        while True:
+            cursor.execute(
+                "DELETE FROM shipments WHERE id <= %s AND created_at < %s LIMIT 10000",
+                (max_id, before)
+            )
+            count = cursor.rowcount
+            if count > 0:
+                _bump(cursor, "shipments")
+            connection.commit()
+            if count <= 0:
+                break
+            deleted += count
+        cursor.close()
+        connection.close()
+        return deleted
+
+    def get_shipment_series(self, metric, archived=None):
+        connection = get_connection()
+        cursor = connection.cursor()
+        # served from idx_shipments_created_at; only two columns leave the db
+        where, params = _where(archived=archived)
+        cursor.execute(f"SELECT created_at, {metric} FROM shipments{where} ORDER BY created_at", params)
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+        return rows
+
+    def get_shipment_buckets(self, metric, bucket_seconds, archived=None):
+        connection = get_connection()
+        cursor = connection.cursor()
+        where, params = _where(archived=archived)
+        # epoch arithmetic on the wall-clock value, as SQLite and the archive
+        # bucket it; UNIX_TIMESTAMP would shift edges by the session time zone
+        cursor.execute(
+            "SELECT CAST('1970-01-01' AS DATETIME) + INTERVAL "
+            "(FLOOR(TIMESTAMPDIFF(SECOND, '1970-01-01', created_at) / %s) * %s) SECOND AS bucket, "
+            f"SUM({metric}), AVG({metric}), COUNT(*) "
+            f"FROM shipments{where} GROUP BY bucket ORDER BY bucket",
+            (bucket_seconds, bucket_seconds) + params
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+        return rows
+
+    def get_shipment_time_range(self, archived=None):
+        connection = get_connection()
+        cursor = connection.cursor()
+        where, params = _where(archived=archived)
+        cursor.execute(f"SELECT MIN(created_at), MAX(created_at), COUNT(*) FROM shipments{where}", params)
+        row = cursor.fetchone()
+        cursor.close()
+        connection.close()
+        return row
+
+    def create_reusable_package(self, qr_id, box_size):
+        connection = get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO reusable_packages (qr_id, box_size) VALUES (%s, %s)",
+                (qr_id, box_size)
+            )
+            _bump(cursor, "packages")
+            connection.commit()
+        except mysql.connector.IntegrityError as e:
+            connection.rollback()
+            raise IntegrityError(str(e)) from e
+        finally:
+            cursor.close()
+            connection.close()
+
+    def scan_reusable_package(self, qr_id):
+        connection = get_connection()
+        cursor = connection.cursor()
+        cursor.execute(
+            "UPDATE reusable_packages SET reuse_count = reuse_count + 1, "
+            "last_used_date = CURRENT_TIMESTAMP WHERE qr_id = %s",
+            (qr_id,)
+        )
+        _bump(cursor, "packages")
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+    def get_reusable_packages(self):
+        connection = get_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM reusable_packages ORDER BY created_date DESC")
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+        return rows
+
+    def update_package_condition(self, qr_id, condition):
+        connection = get_connection()
+        cursor = connection.cursor()
+        cursor.execute(
+            "UPDATE reusable_packages SET package_condition = %s WHERE qr_id = %s",
+            (condition, qr_id)
+        )
+        _bump(cursor, "packages")
+        connection.commit()
+        cursor.close()
+        connection.close()
@@ -0,0 +1,364 @@
+# database/sqlite_backend.py
+
+"""Embedded SQLite storage for single-box stores and CI.
+
+One shared connection serves every thread, serialized by a lock; SQLite
+connections are cheap to keep but not to reopen, and the sqlite3 module
+caches prepared statements per connection.  The database runs in WAL mode
+so streaming readers on their own connections never block writers.
+
+By default every write commits with a full sync before it returns, so an
+acknowledged write is durable.  Batching is opt-in: with
+`SQLITE_COMMIT_INTERVAL` above 0 a write joins the open transaction, which
+commits once `SQLITE_BATCH_SIZE` writes are pending or that many seconds
+after the first of them, whichever comes first.  A crash can then lose up
+to one interval of acknowledged writes.  Data versions move once per
+commit, when the writes become visible to other connections.
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from utils import metrics
+from database import versions
+from database.storage import IntegrityError, StorageBackend
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PATH = os.path.join(PROJECT_ROOT, "data", "smartpack.sqlite3")
+
+# local wall-clock time, as MySQL's CURRENT_TIMESTAMP gives
+_NOW = "datetime('now', 'localtime')"
+
+_SCHEMA = (
+    f"""
+    CREATE TABLE IF NOT EXISTS shipments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_length FLOAT NOT NULL,
+        product_width FLOAT NOT NULL,
+        product_height FLOAT NOT NULL,
+        weight FLOAT NOT NULL,
+        fragile BOOLEAN NOT NULL DEFAULT 0,
+        selected_box VARCHAR(255) NOT NULL,
+        waste_percentage FLOAT NOT NULL,
+        co2_saved FLOAT NOT NULL,
+        cost_saved FLOAT NOT NULL,
+        sustainability_score FLOAT NOT NULL,
+        created_at TIMESTAMP DEFAULT ({_NOW})
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_shipments_created_at ON shipments (created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS inventory (
+        box_size VARCHAR(255) PRIMARY KEY,
+        stock INT DEFAULT 0,
+        usage_count INT DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS reusable_packages (
+        qr_id VARCHAR(255) PRIMARY KEY,
+        box_size VARCHAR(255),
+        reuse_count INT DEFAULT 0,
+        created_date TIMESTAMP DEFAULT ({_NOW}),
+        last_used_date TIMESTAMP DEFAULT NULL,
+        package_condition VARCHAR(50) DEFAULT 'excellent',
+        FOREIGN KEY (box_size) REFERENCES inventory(box_size)
+    )
+    """,
+)
+
+_INSERT_SHIPMENT = """
+    INSERT INTO shipments
+    (product_length, product_width, product_height, weight, fragile,
+     selected_box, waste_percentage, co2_saved,
+     cost_saved, sustainability_score)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value.decode() if isinstance(value, bytes) else value)
+
+
+def _format_timestamp(value):
+    # the stored text form, so comparisons stay plain string comparisons
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _where(before=None, archived=None):
+    """WHERE clause and parameters for the shipment filters."""
+    clauses, params = [], []
+    if before is not None:
+        clauses.append("created_at < ?")
+        params.append(_format_timestamp(before))
+    if archived is not None:
+        clauses.append("(id > ? OR created_at >= ?)")
+        params += [archived[0], _format_timestamp(archived[1])]
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
+
+
+# TIMESTAMP columns come back as datetime, like mysql.connector returns them
+sqlite3.register_converter("TIMESTAMP", _parse_timestamp)
+
+
+class SQLiteBackend(StorageBackend):
+
+    name = "sqlite"
+
+    def __init__(self, path=None, batch_size=None, commit_interval=None):
+        self.path = path or os.getenv("SQLITE_PATH") or DEFAULT_PATH
+        self.batch_size = batch_size if batch_size is not None else int(
+            os.getenv("SQLITE_BATCH_SIZE", 256))
+        self.commit_interval = commit_interval if commit_interval is not None else float(
+            os.getenv("SQLITE_COMMIT_INTERVAL", 0))
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._timer = None
+        # data domains written in the open transaction
+        self._dirty = set()
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # batching already gives up the last interval on a crash; with WAL,
+        # NORMAL only syncs at checkpoints and stays corruption-safe
+        self._conn.execute(
+            "PRAGMA synchronous=NORMAL" if self.commit_interval > 0 else "PRAGMA synchronous=FULL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        atexit.register(self.close)
+
+    def _connect(self):
+        metrics.inc("db_connections_opened_total")
+        conn = sqlite3.connect(
+            self.path,
+            timeout=30,
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=256,
+        )
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _wrote(self):
+        """Account for one write; commit or arm the flush timer (lock held)."""
+        self._pending += 1
+        if self._pending >= self.batch_size or self.commit_interval <= 0:
+            self._commit()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.commit_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _commit(self):
+        self._conn.commit()
+        metrics.inc("sqlite_commits_total")
+        metrics.observe("sqlite_commit_batch_size", self._pending, buckets=(1, 4, 16, 64, 256, 1024))
+        self._pending = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            versions.bump(*dirty)
+
+    def changed(self, *domains):
+        # bump once the write is committed: now, or when its batch commits
+        with self._lock:
+            if self._pending:
+                self._dirty.update(domains)
+            else:
+                versions.bump(*domains)
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self._commit()
+            elif self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+    @contextmanager
+    def _writing(self):
+        """Run one write's statements under the lock.
+
+        A failing statement must not leave the shared connection inside a
+        transaction holding the write lock.  On its own the write is rolled
+        back; inside an open batch only its savepoint is, so the earlier
+        writes still commit with the batch.
+        """
+        with self._lock:
+            batched = self._conn.in_transaction
+            if batched:
+                self._conn.execute("SAVEPOINT write")
+            try:
+                yield self._conn
+            except BaseException as e:
+                if batched:
+                    self._conn.execute("ROLLBACK TO write")
+                    self._conn.execute("RELEASE write")
+                else:
+                    self._conn.rollback()
+                if isinstance(e, sqlite3.IntegrityError):
+                    raise IntegrityError(str(e)) from e
+                raise
+            if batched:
+                self._conn.execute("RELEASE write")
+            self._wrote()
+
+    def _write(self, sql, params=()):
+        with self._writing() as conn:
+            conn.execute(sql, params)
+
+    def _read(self, sql, params=(), dictionary=False):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            rows = cursor.fetchall()
+            if dictionary:
+                names = [d[0] for d in cursor.description]
+                rows = [dict(zip(names, row)) for row in rows]
+            return rows
+
+    def initialize(self):
+        with self._lock:
+            self.flush()
+            # same as the MySQL backend: shipments start empty on every startup
+            self._conn.execute("DROP TABLE IF EXISTS shipments")
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+            self._conn.commit()
+
+    def insert_shipment(self, data):
+        self._write(_INSERT_SHIPMENT, (
+            data["product_length"],
+            data["product_width"],
+            data["product_height"],
+            data["weight"],
+            bool(data.get("fragile", False)),
+            data["selected_box"],
+            data["waste_percentage"],
+            data["co2_saved"],
+            data["cost_saved"],
+            data["sustainability_score"]
+        ))
+
+    def get_inventory(self):
+        return self._read("SELECT box_size, stock, usage_count FROM inventory", dictionary=True)
+
+    def adjust_inventory(self, box_size, change=0, record_use=False):
+        with self._writing() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO inventory (box_size, stock, usage_count) VALUES (?, 0, 0)",
+                (box_size,)
+            )
+            if change != 0:
+                conn.execute(
+                    "UPDATE inventory SET stock = stock + ? WHERE box_size = ?",
+                    (change, box_size)
+                )
+            if record_use:
+                conn.execute(
+                    "UPDATE inventory SET usage_count = usage_count + 1 WHERE box_size = ?",
+                    (box_size,)
+                )
+
+    def get_shipments(self):
+        return self._read("SELECT * FROM shipments", dictionary=True)
+
+    def iter_shipments(self, columns, chunk_size, before=None, archived=None):
+        # a private connection reads a WAL snapshot without holding the lock
+        self.flush()
+        connection = self._connect()
+        try:
+            where, params = _where(before, archived)
+            cursor = connection.execute(
+                f"SELECT {', '.join(columns)} FROM shipments{where} ORDER BY id", params
+            )
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            connection.close()
+
+    def delete_shipments(self, max_id, before):
+        with self._lock:
+            self.flush()
+            try:
+                cursor = self._conn.execute(
+                    "DELETE FROM shipments WHERE id <= ? AND created_at < ?",
+                    (max_id, _format_timestamp(before))
+                )
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+            return cursor.rowcount
+
+    def get_shipment_series(self, metric, archived=None):
+        where, params = _where(archived=archived)
+        return self._read(f"SELECT created_at, {metric} FROM shipments{where} ORDER BY created_at",
+                          params)
+
+    def get_shipment_buckets(self, metric, bucket_seconds, archived=None):
+        where, params = _where(archived=archived)
+        rows = self._read(
+            "SELECT (CAST(strftime('%s', created_at) AS INTEGER) / ?) * ? AS bucket, "
+            f"SUM({metric}), AVG({metric}), COUNT(*) "
+            f"FROM shipments{where} GROUP BY bucket ORDER BY bucket",
+            (int(bucket_seconds), int(bucket_seconds)) + params
+        )
+        # strftime('%s') reads the stored wall-clock time as UTC; convert back
+        # the same way so bucket starts are in the stored time base
+        return [
+            (datetime.fromtimestamp(bucket, timezone.utc).replace(tzinfo=None), total, avg, count)
+            for bucket, total, avg, count in rows
+        ]
+
+    def get_shipment_time_range(self, archived=None):
+        where, params = _where(archived=archived)
+        first, last, count = self._read(
+            f"SELECT MIN(created_at), MAX(created_at), COUNT(*) FROM shipments{where}", params
+        )[0]
+        # aggregates carry no declared type, so parse them here
+        return (
+            _parse_timestamp(first) if first is not None else None,
+            _parse_timestamp(last) if last is not None else None,
+            count,
+        )
+
+    def create_reusable_package(self, qr_id, box_size):
+        self._write(
+            "INSERT INTO reusable_packages (qr_id, box_size) VALUES (?, ?)",
+            (qr_id, box_size)
+        )
+
+    def scan_reusable_package(self, qr_id):
+        self._write(
+            "UPDATE reusable_packages SET reuse_count = reuse_count + 1, "
+            f"last_used_date = {_NOW} WHERE qr_id = ?",
+            (qr_id,)
+        )
+
+    def get_reusable_packages(self):
+        return self._read("SELECT * FROM reusable_packages ORDER BY created_date DESC", dictionary=True)
+
+    def update_package_condition(self, qr_id, condition):
+        self._write(
+            "UPDATE reusable_packages SET package_condition = ? WHERE qr_id = ?",
+            (condition, qr_id)
+        )
+
+
+metrics.describe("sqlite_commits_total", "SQLite transaction commits.")
+metrics.describe("sqlite_commit_batch_size", "Writes per SQLite commit.")
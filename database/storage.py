@@ -0,0 +1,148 @@
+# database/storage.py
+
+"""Storage backend interface and selection.
+
+`database.db` keeps its module-level functions; each one delegates to the
+backend picked by `DB_BACKEND` (`mysql`, the default, or `sqlite`).  A
+backend implements the methods below with the same return shapes: dict
+rows for table reads, tuples for series and range queries.
+"""
+
+import os
+import threading
+
+from database import versions
+
+BACKENDS = ("mysql", "sqlite")
+
+# every column of the shipments table, in table order
+SHIPMENT_COLUMNS = (
+    "id", "product_length", "product_width", "product_height", "weight", "fragile",
+    "selected_box", "waste_percentage", "co2_saved", "cost_saved", "sustainability_score",
+    "created_at",
+)
+
+# what replay and rationalization stream by default
+SHIPMENT_REPLAY_COLUMNS = (
+    "product_length", "product_width", "product_height", "weight", "fragile", "selected_box",
+)
+
+# numeric shipment columns that may be charted over time
+SERIES_METRICS = ("co2_saved", "cost_saved", "waste_percentage", "sustainability_score")
+
+
+class IntegrityError(ValueError):
+    """A write broke a table constraint, e.g. a package for an unknown box size."""
+
+
+class StorageBackend:
+    """Operations every backend provides.
+
+    Callers validate metric and column names before they reach a backend,
+    so implementations may interpolate them into SQL.  Shipment reads take
+    an optional `archived` pair (max id, before) from database/archive.py:
+    rows with id <= max id created before `before` are already in the
+    archive and are left out.
+    """
+
+    name = None
+
+    def initialize(self):
+        """Create required tables if they do not exist."""
+        raise NotImplementedError
+
+    def insert_shipment(self, data):
+        raise NotImplementedError
+
+    def get_inventory(self):
+        raise NotImplementedError
+
+    def adjust_inventory(self, box_size, change=0, record_use=False):
+        raise NotImplementedError
+
+    def get_shipments(self):
+        raise NotImplementedError
+
+    def iter_shipments(self, columns, chunk_size, before=None, archived=None):
+        """Yield lists of row tuples in id order without loading everything.
+
+        With `before`, only rows created before that datetime.
+        """
+        raise NotImplementedError
+
+    def delete_shipments(self, max_id, before):
+        """Delete rows with id <= max_id created before `before`; returns the count."""
+        raise NotImplementedError
+
+    def get_shipment_series(self, metric, archived=None):
+        raise NotImplementedError
+
+    def get_shipment_buckets(self, metric, bucket_seconds, archived=None):
+        raise NotImplementedError
+
+    def get_shipment_time_range(self, archived=None):
+        raise NotImplementedError
+
+    def create_reusable_package(self, qr_id, box_size):
+        raise NotImplementedError
+
+    def scan_reusable_package(self, qr_id):
+        raise NotImplementedError
+
+    def get_reusable_packages(self):
+        raise NotImplementedError
+
+    def update_package_condition(self, qr_id, condition):
+        raise NotImplementedError
+
+    def changed(self, *domains):
+        """Called after a write; bumps the data versions once it is visible."""
+        versions.bump(*domains)
+
+    def version_counters(self):
+        """Data-version counters kept in the database, or None for per-host ones.
+
+        Backends whose database several hosts share return an object with
+        `epoch`, `read(indexes)` and `bump(indexes)` (see database/versions.py),
+        bump it in each write's own transaction and override `changed`.
+        """
+        return None
+
+    def flush(self):
+        """Make buffered writes durable; a no-op for backends that don't buffer."""
+
+    def close(self):
+        self.flush()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name):
+    name = name.lower()
+    if name == "mysql":
+        from database.mysql_backend import MySQLBackend
+        return MySQLBackend()
+    if name == "sqlite":
+        from database.sqlite_backend import SQLiteBackend
+        return SQLiteBackend()
+    raise ValueError(f"DB_BACKEND must be one of {BACKENDS}, got {name!r}")
+
+
+def get_backend():
+    """The process-wide backend, created from the environment on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(os.getenv("DB_BACKEND", "mysql"))
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the process-wide backend (tools and tests); returns the old one."""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
@@ -0,0 +1,182 @@
+# database/versions.py
+
+"""Data-version counters for cheap change detection.
+
+Each data domain has a counter that the write paths in database/db.py
+bump.  Read endpoints derive ETags from the counters, so an unchanged
+resource can be answered with 304 without touching the database.
+
+A backend whose database is shared between hosts keeps the counters in
+that database, bumped in the same transaction as each write (see
+`StorageBackend.version_counters`).  Otherwise they live in a small
+memory-mapped file (`DATA_VERSION_FILE`, default in the temp directory) so
+every worker process on the host sees every bump.  Either store holds a
+random epoch, written when it is created, so that counters which restart
+at zero never repeat an ETag.  Where the file cannot be used, the
+counters fall back to process memory.  That is only correct with a single
+worker process.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; in-process counters only
+    fcntl = None
+
+DOMAINS = ("shipments", "inventory", "packages")
+
+_MAGIC = b"SPVER1\0\0"
+_HEADER = struct.Struct("<8sQ")
+_COUNTER = struct.Struct("<Q")
+_SIZE = _HEADER.size + _COUNTER.size * len(DOMAINS)
+
+
+def _default_path():
+    return os.path.join(tempfile.gettempdir(), "smartpack-data-versions")
+
+
+class _FileCounters:
+
+    def __init__(self, path):
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(self._fd, _HEADER.size, 0)
+                if len(header) < _HEADER.size or _HEADER.unpack(header)[0] != _MAGIC \
+                        or os.fstat(self._fd).st_size < _SIZE:
+                    epoch = struct.unpack("<Q", os.urandom(8))[0]
+                    os.pwrite(self._fd, _HEADER.pack(_MAGIC, epoch) + bytes(_SIZE - _HEADER.size), 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(self._fd, _SIZE)
+        except Exception:
+            os.close(self._fd)
+            raise
+        self.epoch = _HEADER.unpack_from(self._map, 0)[1]
+
+    def bump(self, indexes):
+        # the file lock makes read-modify-write atomic across processes
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            for i in indexes:
+                offset = _HEADER.size + i * _COUNTER.size
+                _COUNTER.pack_into(self._map, offset, _COUNTER.unpack_from(self._map, offset)[0] + 1)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def read(self, indexes):
+        return tuple(_COUNTER.unpack_from(self._map, _HEADER.size + i * _COUNTER.size)[0]
+                     for i in indexes)
+
+
+class _MemoryCounters:
+
+    def __init__(self):
+        self.epoch = struct.unpack("<Q", os.urandom(8))[0]
+        self._values = [0] * len(DOMAINS)
+        self._lock = threading.Lock()
+
+    def bump(self, indexes):
+        with self._lock:
+            for i in indexes:
+                self._values[i] += 1
+
+    def read(self, indexes):
+        return tuple(self._values[i] for i in indexes)
+
+
+_counters = None
+_counters_lock = threading.Lock()
+# bumps made by this process, to tell them apart from other workers'
+_local = [0] * len(DOMAINS)
+
+
+def _get():
+    global _counters
+    if _counters is None:
+        with _counters_lock:
+            if _counters is None:
+                from database.storage import get_backend
+                _counters = get_backend().version_counters() or _host_counters()
+    return _counters
+
+
+def _host_counters():
+    path = os.getenv("DATA_VERSION_FILE") or _default_path()
+    try:
+        if fcntl is None:
+            raise OSError("file locking unavailable")
+        return _FileCounters(path)
+    except OSError as e:
+        print(f"data versions: using in-process counters ({e})")
+        return _MemoryCounters()
+
+
+def _indexes(domains):
+    try:
+        return [DOMAINS.index(d) for d in domains]
+    except ValueError:
+        raise ValueError(f"unknown data domain in {domains}; expected {DOMAINS}")
+
+
+def bump(*domains):
+    """Record that data in `domains` changed."""
+    indexes = _indexes(domains)
+    _get().bump(indexes)
+    _count_local(indexes)
+
+
+def bumped(*domains):
+    """Record changes whose counters the backend bumped in its own transaction."""
+    _count_local(_indexes(domains))
+
+
+def _count_local(indexes):
+    with _counters_lock:
+        for i in indexes:
+            _local[i] += 1
+
+
+def current(*domains):
+    """Current counters for `domains`, in order."""
+    return _get().read(_indexes(domains))
+
+
+def local_bumps():
+    """Bumps made by this process, per domain in DOMAINS order."""
+    with _counters_lock:
+        return tuple(_local)
+
+
+def etag(*domains, extra=None):
+    """Weak ETag for a resource derived from `domains` (and `extra`, e.g. a catalog version).
+
+    Weak because compression changes the bytes but not the meaning.
+    """
+    counters = _get()
+    parts = [f"{counters.epoch:x}"] + [str(v) for v in counters.read(_indexes(domains))]
+    if extra:
+        parts.append(str(extra))
+    return 'W/"' + "-".join(parts) + '"'
+
+
+def matches(if_none_match, tag):
+    """If-None-Match comparison (weak, as RFC 9110 requires for this header)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = tag[2:] if tag.startswith("W/") else tag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
@@ -1,7 +1,14 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 import requests
 import pandas as pd
 import plotly.express as px
+from cachetools import LRUCache, TTLCache
+from streamlit_autorefresh import st_autorefresh
 
 # ---------------- PAGE CONFIG ----------------
 st.set_page_config(
@@ -17,26 +24,264 @@ st.markdown("""
 Reducing retail packaging waste, cost, and carbon emissions using intelligent box selection.
 """)
 
+# ---------------- API CLIENT ----------------
+CACHE_TTL_SECONDS = 30
+# a full-width chart cannot show more distinct points than this
+CHART_POINTS = 800
+SERIES_PATH = f"/shipments/series?metric=co2_saved&points={CHART_POINTS}"
+# analytics totals; the full history is never downloaded
+SUMMARY_PATH = "/shipments/summary"
+# tables come as column arrays: smaller, and they load straight into DataFrames
+STORAGE_PATH = "/storage?format=columns"
+PACKAGES_PATH = "/reusable/list?format=columns"
+# how often the page reruns to show pushed changes
+LIVE_REFRESH_SECONDS = 5
+
+
+def get_backend_url():
+    """Resolve the API base URL.
+
+    In production we point at the deployed API; during local development we
+    hit localhost. Users can override by setting BACKEND_URL in a
+    secrets.toml or via environment variable. An empty or missing secrets
+    file should not crash the app.
+    """
+    try:
+        base_url = st.secrets.get("BACKEND_URL")
+    except Exception:
+        base_url = None
+    if not base_url:
+        # fall back to environment variable too, useful for CI/containers
+        base_url = os.environ.get("BACKEND_URL")
+    if not base_url:
+        base_url = "http://127.0.0.1:8000"
+    return base_url.rstrip("/")
+
+
+@st.cache_resource
+def get_session():
+    """One keep-alive HTTP session shared by every rerun and session."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_resource
+def get_response_cache():
+    """TTL cache of GET responses keyed by path, shared across reruns.
+
+    Held as a resource (not st.cache_data) so the prefetch threads can use
+    it and mutations can drop individual entries.  Each value is a
+    one-item list holding the body, so a pushed change can swap the body
+    without restarting the entry's TTL.  The second cache keeps the last
+    (ETag, body) per path beyond the TTL for conditional GETs.
+    """
+    return TTLCache(maxsize=64, ttl=CACHE_TTL_SECONDS), LRUCache(maxsize=64), threading.Lock()
+
+
+API_URL = get_backend_url()
+SESSION = get_session()
+RESPONSE_CACHE, VALIDATED_CACHE, RESPONSE_CACHE_LOCK = get_response_cache()
+
+
+def api_get(path):
+    """GET `path` through the TTL cache; failures are not cached.
+
+    Expired entries are revalidated with If-None-Match, so an unchanged
+    resource costs a bodyless 304 instead of a full download.
+    """
+    with RESPONSE_CACHE_LOCK:
+        if path in RESPONSE_CACHE:
+            return RESPONSE_CACHE[path][0]
+        validated = VALIDATED_CACHE.get(path)
+    headers = {"If-None-Match": validated[0]} if validated else {}
+    resp = SESSION.get(f"{API_URL}{path}", headers=headers, timeout=5)
+    if resp.status_code == 304 and validated:
+        data = validated[1]
+    else:
+        resp.raise_for_status()
+        data = resp.json()
+    with RESPONSE_CACHE_LOCK:
+        RESPONSE_CACHE[path] = [data]
+        etag = resp.headers.get("ETag")
+        if etag:
+            VALIDATED_CACHE[path] = (etag, data)
+    return data
+
+
+def invalidate(*paths):
+    """Drop cached responses made stale by a mutation.
+
+    Their ETags are kept: the server decides whether they still match.
+    """
+    with RESPONSE_CACHE_LOCK:
+        # entries are keyed by full path, query string included
+        for key in list(RESPONSE_CACHE.keys()):
+            if key.split("?", 1)[0] in paths:
+                RESPONSE_CACHE.pop(key, None)
+
+
+def prefetch(paths):
+    """Warm the cache for independent endpoints concurrently.
+
+    A rerun then costs one round-trip of latency instead of one per tab.
+    """
+    with RESPONSE_CACHE_LOCK:
+        missing = [p for p in paths if p not in RESPONSE_CACHE]
+    if not missing:
+        return
+
+    def fetch(path):
+        try:
+            api_get(path)
+        except Exception:
+            # the per-tab fetch functions report unavailability
+            pass
+
+    with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+        list(pool.map(fetch, missing))
+
+
+# ---------------- LIVE UPDATES ----------------
+# data domains named by `invalidate` events and the cached paths built from them
+DOMAIN_PATHS = {
+    "shipments": ("/shipments", "/shipments/summary", "/shipments/series", "/forecast",
+                  "/forecast/reorder"),
+    "inventory": ("/inventory", "/storage", "/forecast/reorder"),
+    "packages": ("/reusable/list", "/reuse-score"),
+}
+
+
+def _patch(path, update):
+    """Replace a cached response with `update(copy)`; readers keep the old object.
+
+    The entry keeps its original expiry, so patched data is still
+    refetched once the TTL is up.
+    """
+    with RESPONSE_CACHE_LOCK:
+        entry = RESPONSE_CACHE.get(path)
+        if entry is None:
+            return
+        try:
+            entry[0] = update(entry[0])
+        except (KeyError, TypeError, ValueError):
+            RESPONSE_CACHE.pop(path, None)
+
+
+def _add_shipment(data, event):
+    totals = {name: value + event[name] for name, value in data["totals"].items()}
+    by_box = dict(data["by_box"])
+    by_box[event["selected_box"]] = by_box.get(event["selected_box"], 0) + 1
+    return {"shipments": data["shipments"] + 1, "totals": totals, "by_box": by_box}
+
+
+def _apply_stock(data, event):
+    rows = [dict(row) for row in data["inventory"]]
+    for row in rows:
+        if row["box_size"] == event["box_size"]:
+            row["stock"] += event["change"]
+            row["usage_count"] += 1 if event["used"] else 0
+            return {**data, "inventory": rows}
+    raise KeyError(event["box_size"])
+
+
+def apply_event(event_type, event):
+    """Bring the response cache up to date with one pushed change."""
+    if event_type == "shipment":
+        _patch(SUMMARY_PATH, lambda data: _add_shipment(data, event))
+        invalidate("/shipments/series", "/forecast", "/forecast/reorder")
+    elif event_type == "stock":
+        _patch("/inventory", lambda data: _apply_stock(data, event))
+        invalidate("/storage", "/forecast/reorder")
+    elif event_type == "package":
+        invalidate("/reusable/list", "/reuse-score")
+    elif event_type == "invalidate":
+        invalidate(*(p for d in event.get("domains", []) for p in DOMAIN_PATHS.get(d, ())))
+    elif event_type == "resync":
+        invalidate(*(p for paths in DOMAIN_PATHS.values() for p in paths))
+
+
+def _sequence(event_id):
+    """(server epoch, number) of an event id, or None if it has none."""
+    epoch, _, number = (event_id or "").partition("-")
+    return (epoch, int(number)) if number.isdigit() else None
+
+
+def listen(stop):
+    """Follow /events, resuming with Last-Event-ID after a dropped connection.
+
+    Ids are numbered without gaps per server process.  Whenever one is
+    skipped, or events may have been missed before the stream opened,
+    every cached response is dropped and refetched instead of patched.
+    """
+    last_id = None
+    while not stop.is_set():
+        headers = {"Accept": "text/event-stream"}
+        if last_id:
+            headers["Last-Event-ID"] = last_id
+        try:
+            # its own connection: the stream would hold a pooled one forever
+            with requests.get(f"{API_URL}/events", headers=headers, stream=True,
+                              timeout=(5, 60)) as resp:
+                resp.raise_for_status()
+                if not last_id:
+                    # anything written before this point is not replayed
+                    apply_event("resync", {})
+                event_id, event_type, data = None, None, []
+                for line in resp.iter_lines(decode_unicode=True):
+                    if stop.is_set():
+                        return
+                    if line:
+                        field, _, value = line.partition(":")
+                        value = value[1:] if value.startswith(" ") else value
+                        if field == "id":
+                            event_id = value
+                        elif field == "event":
+                            event_type = value
+                        elif field == "data":
+                            data.append(value)
+                        continue
+                    # a blank line ends the event
+                    if event_type and data:
+                        seen, current = _sequence(last_id), _sequence(event_id)
+                        if seen and current and current != (seen[0], seen[1] + 1):
+                            apply_event("resync", {})
+                        apply_event(event_type, json.loads("\n".join(data)))
+                    if event_id:
+                        last_id = event_id
+                    event_id, event_type, data = None, None, []
+        except (requests.RequestException, ValueError):
+            pass
+        stop.wait(3)
+
+
+@st.cache_resource
+def start_listener():
+    """One background listener per server process, shared by every session."""
+    stop = threading.Event()
+    threading.Thread(target=listen, args=(stop,), daemon=True, name="events-listener").start()
+    return stop
+
+
 # ---------------- FETCH DATA FUNCTION ----------------
-def fetch_data():
-    """Retrieve past shipment records via backend API.
+def fetch_summary():
+    """Shipment totals over the whole history via the backend API.
 
     The frontend used to connect directly to MySQL, but the correct
-    architecture is to go through FastAPI. A `/shipments` endpoint was
-    added to the backend for this purpose.
+    architecture is to go through FastAPI.  The backend sums archived
+    weeks from its rollups, so this stays small however long the history.
     """
     try:
-        resp = requests.get("http://127.0.0.1:8000/shipments", timeout=5)
-        data = resp.json().get("shipments", [])
-        return pd.DataFrame(data)
+        return api_get(SUMMARY_PATH)
     except Exception:
-        return pd.DataFrame()
+        return {"shipments": 0, "totals": {}, "by_box": {}}
 
 # ---------------- INVENTORY FUNCTIONS ----------------
 def fetch_inventory():
     try:
-        resp = requests.get("http://127.0.0.1:8000/inventory", timeout=5)
-        data = resp.json().get("inventory", [])
+        data = api_get("/inventory").get("inventory", [])
         return pd.DataFrame(data)
     except Exception:
         return pd.DataFrame(columns=["box_size", "stock", "usage_count"])
@@ -44,28 +289,49 @@ def fetch_inventory():
 
 def update_inventory(box_size: str, change: int):
     try:
-        requests.post(
-            "http://127.0.0.1:8000/inventory/update",
+        SESSION.post(
+            f"{API_URL}/inventory/update",
             params={"box_size": box_size, "change": change},
             timeout=5
         )
     except Exception:
         st.error("Failed to update inventory. Is backend running?")
+    invalidate("/inventory", "/storage", "/forecast/reorder")
 
 
 def fetch_storage():
     try:
-        resp = requests.get("http://127.0.0.1:8000/storage", timeout=5)
-        data = resp.json()
-        return data
+        return api_get(STORAGE_PATH)
     except Exception:
         return {"storage": [], "total_area": 0}
 
 
+def fetch_co2_series():
+    """CO2 saved over time, already downsampled by the backend."""
+    try:
+        data = api_get(SERIES_PATH).get("series", [])
+        return pd.DataFrame(data)
+    except Exception:
+        return pd.DataFrame()
+
+
+def fetch_forecast():
+    try:
+        return api_get("/forecast")
+    except Exception:
+        return None
+
+
+def fetch_reorder():
+    try:
+        return api_get("/forecast/reorder")
+    except Exception:
+        return None
+
+
 def fetch_reusable_packages():
     try:
-        resp = requests.get("http://127.0.0.1:8000/reusable/list", timeout=5)
-        data = resp.json().get("packages", [])
+        data = api_get(PACKAGES_PATH).get("packages", {})
         df = pd.DataFrame(data) if data else pd.DataFrame()
         # backend now returns `package_condition` renamed back to `condition`
         if "package_condition" in df.columns:
@@ -77,8 +343,8 @@ def fetch_reusable_packages():
 
 def create_new_reusable(box_size: str):
     try:
-        resp = requests.post(
-            "http://127.0.0.1:8000/reusable/create",
+        resp = SESSION.post(
+            f"{API_URL}/reusable/create",
             params={"box_size": box_size},
             timeout=5
         )
@@ -86,30 +352,42 @@ def create_new_reusable(box_size: str):
     except Exception:
         st.error("Failed to create reusable package")
         return None
+    finally:
+        invalidate("/reusable/list", "/reuse-score")
 
 
 def scan_package(qr_id: str):
     try:
-        requests.post(
-            "http://127.0.0.1:8000/reusable/scan",
+        SESSION.post(
+            f"{API_URL}/reusable/scan",
             params={"qr_id": qr_id},
             timeout=5
         )
     except Exception:
         st.error("Failed to scan package")
+    invalidate("/reusable/list", "/reuse-score")
 
 
 def fetch_reuse_score():
     try:
-        resp = requests.get("http://127.0.0.1:8000/reuse-score", timeout=5)
-        return resp.json()
+        return api_get("/reuse-score")
     except Exception:
         return {}
 
+
+start_listener()
+
+# all tabs render on every rerun, so fetch their data in one parallel burst
+prefetch([SUMMARY_PATH, SERIES_PATH, "/inventory", STORAGE_PATH, PACKAGES_PATH, "/reuse-score",
+          "/forecast", "/forecast/reorder"])
+
 # sidebar controls
 with st.sidebar:
     st.header("Controls")
     st.write("Use the tabs above to navigate between modules.")
+    # changes are pushed into the cache, so a rerun is cheap
+    if st.toggle("Live updates", value=True):
+        st_autorefresh(interval=LIVE_REFRESH_SECONDS * 1000, key="live-refresh")
     # additional filters can go here (date range, category, etc.)
 
 # create tabs layout
@@ -124,42 +402,35 @@ with tab1:
     height = st.number_input("Height (cm)")
     weight = st.number_input("Weight (kg)")
     fragile = st.checkbox("Fragile")
+    objective = st.selectbox(
+        "Optimize for",
+        ["waste", "cost", "co2"],
+        format_func={"waste": "Least empty space", "cost": "Lowest box cost", "co2": "Lowest CO2"}.get,
+    )
 
     if st.button("Optimize Packaging"):
 
-        # determine where to send the request.  in production we point at
-        # the deployed API; during local development we hit localhost and
-        # include the `/optimize` path so the backend actually knows what to
-        # do.  users can override by setting BACKEND_URL in a secrets.toml
-        # or via environment variable.  empty or missing secrets file should
-        # not crash the app.
-        try:
-            base_url = st.secrets.get("BACKEND_URL")
-        except Exception:
-            base_url = None
-        if not base_url:
-            # fall back to environment variable too, useful for CI/containers
-            import os
-            base_url = os.environ.get("BACKEND_URL")
-        if not base_url:
-            base_url = "http://127.0.0.1:8000"
-        endpoint = f"{base_url.rstrip('/')}/optimize"
+        endpoint = f"{API_URL}/optimize"
 
         try:
-            response = requests.post(
+            response = SESSION.post(
                 endpoint,
                 json={
                     "length": length,
                     "width": width,
                     "height": height,
                     "weight": weight,
-                    "fragile": fragile
+                    "fragile": fragile,
+                    "objective": objective,
                 },
                 timeout=5,
             )
             response.raise_for_status()
 
             result = response.json()
+            # a new shipment changes analytics, stock and the forecast
+            invalidate("/shipments", "/shipments/summary", "/shipments/series", "/inventory",
+                       "/storage", "/forecast", "/forecast/reorder")
 
             opt = result["optimization"]
             carbon = result["carbon_analysis"]
@@ -228,14 +499,14 @@ with tab2:
 with tab3:
     st.subheader("📊 Analytics Dashboard")
 
-    df = fetch_data()
+    summary = fetch_summary()
 
-    if not df.empty:
+    if summary["shipments"]:
 
-        total_shipments = len(df)
-        total_co2 = df["co2_saved"].sum()
-        total_cost = df["cost_saved"].sum()
-        avg_waste = df["waste_percentage"].mean()
+        total_shipments = summary["shipments"]
+        total_co2 = summary["totals"]["co2_saved"]
+        total_cost = summary["totals"]["cost_saved"]
+        avg_waste = summary["totals"]["waste_percentage"] / total_shipments
 
         col1, col2, col3, col4 = st.columns(4)
 
@@ -246,17 +517,19 @@ with tab3:
 
         st.markdown("---")
 
-        fig1 = px.line(
-            df,
-            x="created_at",
-            y="co2_saved",
-            title="🌍 CO2 Saved Over Time",
-            markers=True
-        )
-        st.plotly_chart(fig1, use_container_width=True)
+        # the backend reduces the series to what the chart can display
+        series = fetch_co2_series()
+        if not series.empty:
+            fig1 = px.line(
+                series,
+                x="created_at",
+                y="co2_saved",
+                title="🌍 CO2 Saved Over Time",
+                markers=len(series) < 200
+            )
+            st.plotly_chart(fig1, use_container_width=True)
 
-        box_counts = df["selected_box"].value_counts().reset_index()
-        box_counts.columns = ["Box", "Count"]
+        box_counts = pd.DataFrame(list(summary["by_box"].items()), columns=["Box", "Count"])
 
         fig2 = px.pie(
             box_counts,
@@ -268,27 +541,39 @@ with tab3:
 
         # demand forecasting section
         st.markdown("### 📈 Demand Forecast")
-        try:
-            resp = requests.get("http://127.0.0.1:8000/forecast", timeout=5)
-            fc = resp.json()
-            if "error" in fc:
-                st.warning(fc["error"])
-            else:
-                st.metric("Predicted shipments next week", fc.get("overall_next_week", 0))
-                by_box = fc.get("by_box", {})
-                if by_box:
-                    df_pred = pd.DataFrame(list(by_box.items()), columns=["Box", "Predicted"])
-                    st.table(df_pred)
-                # plot history with predicted point
-                hist = fc.get("history", [])
-                if hist:
-                    weeks = list(range(1, len(hist) + 1))
-                    fig3 = px.line(x=weeks, y=hist, title="Weekly Shipments History", markers=True)
-                    # add predicted point
-                    fig3.add_scatter(x=[len(hist)+1], y=[fc.get("overall_next_week", 0)], mode='markers', name='Forecast')
-                    st.plotly_chart(fig3, use_container_width=True)
-        except Exception:
+        fc = fetch_forecast()
+        if fc is None:
             st.warning("Forecast service unavailable")
+        elif "error" in fc:
+            st.warning(fc["error"])
+        else:
+            st.metric("Predicted shipments next week", fc.get("overall_next_week", 0))
+            by_box = fc.get("by_box", {})
+            if by_box:
+                df_pred = pd.DataFrame(list(by_box.items()), columns=["Box", "Predicted"])
+                st.table(df_pred)
+            # plot history with the forecast and its interval
+            hist = fc.get("history", [])
+            if hist:
+                overall = fc.get("overall", {})
+                hist_weeks = fc.get("history_weeks") or list(range(1, len(hist) + 1))
+                fc_weeks = fc.get("weeks") or list(range(len(hist) + 1, len(hist) + 1 + len(overall.get("mean", []))))
+                fig3 = px.line(x=hist_weeks, y=hist, title="Weekly Shipments History", markers=True)
+                if overall.get("mean"):
+                    fig3.add_scatter(x=fc_weeks, y=overall["upper"], mode="lines", line_width=0,
+                                     showlegend=False, name="Upper")
+                    fig3.add_scatter(x=fc_weeks, y=overall["lower"], mode="lines", line_width=0,
+                                     fill="tonexty", name=f"{int(fc.get('level', 0.8) * 100)}% interval")
+                    fig3.add_scatter(x=fc_weeks, y=overall["mean"], mode="lines+markers", name="Forecast")
+                st.plotly_chart(fig3, use_container_width=True)
+
+            # replenishment suggestions against current stock
+            reorder = fetch_reorder()
+            if reorder and reorder.get("boxes"):
+                st.markdown("#### 🔁 Reorder Points")
+                st.caption(f"{reorder['lead_weeks']}-week lead time, "
+                           f"{int(reorder['service_level'] * 100)}% service level")
+                st.dataframe(pd.DataFrame(reorder["boxes"]), use_container_width=True)
 
     else:
         st.info("No shipment data available yet.")
@@ -13,7 +13,8 @@ def run_optimization(product_length: float,
                      product_width: float,
                      product_height: float,
                      weight: float,
-                     fragile: bool):
+                     fragile: bool,
+                     category: str = None):
     """Perform optimization and carbon analysis, then persist to database.
 
     Returns a tuple of (result, carbon_result) where either may contain an
@@ -22,8 +23,10 @@ def run_optimization(product_length: float,
     # paths are resolved relative to this file so the module can be
     # imported from anywhere in the package.
     base = Path(__file__).parent
-    optimizer = SmartPackagingOptimizer(str(base / "data" / "boxes.csv"))
     carbon_calc = CarbonCalculator(str(base / "data" / "material_carbon_data.csv"))
+    optimizer = SmartPackagingOptimizer(
+        str(base / "data" / "boxes.csv"), co2_factors=carbon_calc.co2_factors
+    )
 
     result = optimizer.optimize(
         product_length=product_length,
@@ -35,17 +38,9 @@ def run_optimization(product_length: float,
 
     carbon_result = None
     if "error" not in result:
-        optimized_volume = (
-            result["box_dimensions"][0]
-            * result["box_dimensions"][1]
-            * result["box_dimensions"][2]
-        )
-        default_volume = optimized_volume * 1.5
-        carbon_result = carbon_calc.calculate(
-            optimized_box={"cost_per_box": 25},
-            default_box_volume=default_volume,
-            optimized_box_volume=optimized_volume,
-        )
+        # compare against the category's default box (see
+        # data/default_packaging.csv), or a 1.5x oversize box if unknown
+        carbon_result = carbon_calc.analyze(result, category=category)
 
         # persist the shipment to the database
         shipment_data = {
@@ -53,6 +48,7 @@ def run_optimization(product_length: float,
             "product_width": product_width,
             "product_height": product_height,
             "weight": weight,
+            "fragile": fragile,
             "selected_box": result.get("selected_box"),
             "waste_percentage": result.get("waste_percentage"),
             "co2_saved": carbon_result.get("co2_saved_kg"),
@@ -93,6 +89,10 @@ def main():
         action="store_true",
         help="Flag to indicate product is fragile",
     )
+    parser.add_argument(
+        "--category",
+        help="Product category from data/default_packaging.csv (e.g. books)",
+    )
     parser.add_argument(
         "--sample",
         action="store_true",
@@ -131,7 +131,8 @@ def main():
             return
 
     result, carbon_result = run_optimization(
-        args.length, args.width, args.height, args.weight, args.fragile
+        args.length, args.width, args.height, args.weight, args.fragile,
+        args.category,
     )
 
     print("\n" + "=" * 50)
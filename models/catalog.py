@@ -0,0 +1,154 @@
+# models/catalog.py
+
+"""Versioned, hot-reloadable box catalog.
+
+A `Catalog` is an immutable snapshot of the reference data (box sizes and
+material factors) together with the optimizer and carbon calculator built
+from it.  `CatalogManager` polls the data files, builds a new snapshot in
+the background when they change and swaps it in with a single reference
+assignment, so requests that already hold the old snapshot finish on it
+undisturbed.  When an up-to-date compiled artifact (see
+models/compiled_catalog.py) sits next to the CSVs it is memory-mapped
+instead of parsing them.  The artifact records the mtime and size of the
+CSVs it was compiled from; while those still match, the CSVs are not read
+at all, and only when they differ is it checked against a content hash.
+"""
+
+import os
+import threading
+import time
+
+from models.compiled_catalog import (
+    DEFAULT_FILENAME,
+    SOURCE_FILES,
+    read_header,
+    source_stamps,
+    source_version,
+)
+from models.optimizer import SmartPackagingOptimizer
+from utils.carbon_calculator import CarbonCalculator
+
+
+class Catalog:
+
+    def __init__(self, version, optimizer, carbon_calc, source):
+        self.version = version
+        self.optimizer = optimizer
+        self.carbon_calc = carbon_calc
+        self.source = source
+        self.loaded_at = time.time()
+
+    def __len__(self):
+        return len(self.optimizer)
+
+    @property
+    def boxes(self):
+        """Full box table; O(catalog) for compiled catalogs, so batch jobs only."""
+        return self.optimizer.boxes
+
+    def lookup(self, box_ids, columns=("length_cm", "width_cm", "height_cm")):
+        return self.optimizer.lookup(box_ids, columns)
+
+
+class CatalogManager:
+
+    def __init__(self, data_dir, poll_interval=None):
+        self.data_dir = data_dir
+        if poll_interval is None:
+            poll_interval = float(os.getenv("CATALOG_POLL_SECONDS", 30))
+        self.poll_interval = poll_interval
+        self._listeners = []
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stamp = self._file_stamp()
+        self._current = self._build()
+
+    @property
+    def current(self):
+        """The active snapshot; read it once per request and keep using it."""
+        return self._current
+
+    def _path(self, name):
+        return os.path.join(self.data_dir, name)
+
+    def _file_stamp(self):
+        stamp = []
+        for name in SOURCE_FILES + (DEFAULT_FILENAME,):
+            try:
+                st = os.stat(self._path(name))
+            except FileNotFoundError:
+                stamp.append(None)
+                continue
+            stamp.append((st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    def _content_version(self):
+        return source_version(self.data_dir)
+
+    def _build(self):
+        # prefer the memory-mapped artifact, but only when it was compiled
+        # from the CSVs currently on disk
+        compiled = self._path(DEFAULT_FILENAME)
+        try:
+            header = read_header(compiled)
+        except (OSError, ValueError):
+            header = None
+        if header is not None and header.get("sources") == source_stamps(self.data_dir):
+            version, use_compiled = header["version"], True
+        else:
+            version = self._content_version()
+            use_compiled = header is not None and header["version"] == version
+        if use_compiled:
+            boxes_path = materials_path = compiled
+        else:
+            boxes_path = self._path("boxes.csv")
+            materials_path = self._path("material_carbon_data.csv")
+        carbon_calc = CarbonCalculator(materials_path)
+        return Catalog(
+            version=version,
+            optimizer=SmartPackagingOptimizer(boxes_path, co2_factors=carbon_calc.co2_factors),
+            carbon_calc=carbon_calc,
+            source="compiled" if use_compiled else "csv",
+        )
+
+    def add_listener(self, callback):
+        """Call `callback(old, new)` after every swap, e.g. to drop caches."""
+        self._listeners.append(callback)
+
+    def reload(self, force=False):
+        """Rebuild the catalog if its files changed; return True on swap."""
+        with self._reload_lock:
+            stamp = self._file_stamp()
+            if stamp == self._stamp and not force:
+                return False
+            # CSVs touched without edit and no new artifact: nothing to rebuild
+            same_artifact = stamp[-1] == self._stamp[-1]
+            if same_artifact and self._content_version() == self._current.version and not force:
+                self._stamp = stamp
+                return False
+            new = self._build()
+            # only now: a failed build keeps the old stamp and is retried
+            self._stamp = stamp
+            old, self._current = self._current, new
+        print("Catalog reloaded:", old.version, "->", new.version)
+        for callback in self._listeners:
+            callback(old, new)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                # keep serving the previous snapshot on a bad/partial file
+                print("Catalog reload failed:", e)
+
+    def start_watching(self):
+        if self.poll_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, daemon=True, name="catalog-watcher")
+        self._thread.start()
+
+    def stop_watching(self):
+        self._stop.set()
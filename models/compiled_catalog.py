@@ -0,0 +1,236 @@
+# models/compiled_catalog.py
+
+"""Pre-compiled binary catalog.
+
+`compile_catalog` turns the three reference CSVs into one file of
+fixed-width NumPy arrays; `load_compiled` memory-maps it back.  Mapping is
+read-only, so every worker process on a host shares the same page-cache
+copy and load time does not grow with the catalog.
+
+File layout (little endian)::
+
+    8 bytes   magic  b"SPOCAT1\\0"
+    4 bytes   uint32 header length
+    n bytes   JSON header: source version, source file stamps and
+              {name: offset, shape, descr}
+    ...       arrays, each starting on a 64-byte boundary
+
+Arrays:
+
+* ``boxes``      structured rows of boxes.csv, in file order
+* ``fit_index``  float64 (5, n_boxes): length, width, height, max weight and
+                 volume, with columns sorted by volume so the first box that
+                 fits is also the one with the least empty space
+* ``fit_order``  int32 row in ``boxes`` for each ``fit_index`` column
+* ``id_order``   int32 rows of ``boxes`` sorted by box_id, for lookups by ID
+* ``materials``  structured rows of material_carbon_data.csv
+* ``defaults``   structured rows of default_packaging.csv
+
+Text fields are fixed-width bytes, at least as wide as the dtypes below and
+widened at compile time to the longest value, so nothing is truncated.
+
+Usage::
+
+    python -m models.compiled_catalog [data_dir] [output_path]
+"""
+
+import hashlib
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b"SPOCAT1\0"
+ALIGN = 64
+SOURCE_FILES = ("boxes.csv", "material_carbon_data.csv", "default_packaging.csv")
+DEFAULT_FILENAME = "catalog.spcat"
+
+BOX_DTYPE = np.dtype([
+    ("box_id", "S32"),
+    ("length_cm", "<f8"),
+    ("width_cm", "<f8"),
+    ("height_cm", "<f8"),
+    ("max_weight_kg", "<f8"),
+    ("material_type", "S32"),
+    ("cost_per_box", "<f8"),
+])
+MATERIAL_DTYPE = np.dtype([
+    ("material_type", "S32"),
+    ("co2_per_kg_kg", "<f8"),
+    ("cost_per_kg", "<f8"),
+    ("recyclability_score", "<f8"),
+])
+DEFAULT_DTYPE = np.dtype([
+    ("product_category", "S64"),
+    ("default_box_length", "<f8"),
+    ("default_box_width", "<f8"),
+    ("default_box_height", "<f8"),
+])
+
+
+def source_version(data_dir):
+    """Short content hash of the reference CSVs; doubles as catalog version."""
+    digest = hashlib.sha1()
+    for name in SOURCE_FILES:
+        with open(os.path.join(data_dir, name), "rb") as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()[:12]
+
+
+def source_stamps(data_dir):
+    """{file: [mtime_ns, size]} of the reference CSVs, cheap to compare."""
+    stamps = {}
+    for name in SOURCE_FILES:
+        st = os.stat(os.path.join(data_dir, name))
+        stamps[name] = [st.st_mtime_ns, st.st_size]
+    return stamps
+
+
+def _to_records(df, dtype):
+    encoded = {
+        name: [str(v).encode() for v in df[name]]
+        for name in dtype.names if dtype[name].kind == "S"
+    }
+    # text columns grow to fit their longest value
+    dtype = np.dtype([
+        (name, f"S{max([dtype[name].itemsize] + [len(v) for v in encoded[name]])}")
+        if name in encoded else (name, dtype[name])
+        for name in dtype.names
+    ])
+    out = np.zeros(len(df), dtype=dtype)
+    for name in dtype.names:
+        if name in encoded:
+            out[name] = encoded[name]
+        else:
+            out[name] = df[name].to_numpy(dtype=np.float64)
+    return out
+
+
+def build_fit_index(boxes):
+    """Return (fit_index, fit_order) for a structured or DataFrame box table."""
+    length = np.asarray(boxes["length_cm"], dtype=np.float64)
+    width = np.asarray(boxes["width_cm"], dtype=np.float64)
+    height = np.asarray(boxes["height_cm"], dtype=np.float64)
+    max_weight = np.asarray(boxes["max_weight_kg"], dtype=np.float64)
+    volume = length * width * height
+    # stable sort keeps file order between equal volumes, matching the
+    # strict "<" tie-break of the original row scan
+    order = np.argsort(volume, kind="stable").astype(np.int32)
+    index = np.vstack([length, width, height, max_weight, volume])[:, order]
+    return np.ascontiguousarray(index), order
+
+
+def compile_catalog(data_dir, output_path=None):
+    """Compile the CSV catalogs in `data_dir` into one binary artifact."""
+    if output_path is None:
+        output_path = os.path.join(data_dir, DEFAULT_FILENAME)
+    # taken before reading, so an edit made while compiling shows up as a
+    # stamp mismatch and the artifact is checked by content instead
+    sources = source_stamps(data_dir)
+    version = source_version(data_dir)
+
+    boxes = _to_records(pd.read_csv(os.path.join(data_dir, "boxes.csv")), BOX_DTYPE)
+    fit_index, fit_order = build_fit_index(boxes)
+    arrays = {
+        "boxes": boxes,
+        "fit_index": fit_index,
+        "fit_order": fit_order,
+        "id_order": np.argsort(boxes["box_id"], kind="stable").astype(np.int32),
+        "materials": _to_records(
+            pd.read_csv(os.path.join(data_dir, "material_carbon_data.csv")), MATERIAL_DTYPE
+        ),
+        "defaults": _to_records(
+            pd.read_csv(os.path.join(data_dir, "default_packaging.csv")), DEFAULT_DTYPE
+        ),
+    }
+
+    # lay out arrays after a generously sized header so offsets are known
+    # before the header is serialized
+    entries = {
+        name: {
+            "shape": list(arr.shape),
+            "descr": arr.dtype.descr if arr.dtype.names else arr.dtype.str,
+        }
+        for name, arr in arrays.items()
+    }
+    header_room = ALIGN * (len(json.dumps([version, sources, entries])) // ALIGN + 4)
+    offset = _align(len(MAGIC) + 4 + header_room)
+    for name, arr in arrays.items():
+        entries[name]["offset"] = offset
+        offset = _align(offset + arr.nbytes)
+    header = json.dumps({"version": version, "sources": sources, "arrays": entries}).encode()
+    if len(header) > header_room:
+        raise RuntimeError("catalog header larger than reserved space")
+
+    # write beside the target and rename so processes that already mapped
+    # the previous file keep a valid mapping
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack("<I", len(header)))
+        fh.write(header)
+        for name, arr in arrays.items():
+            fh.seek(entries[name]["offset"])
+            fh.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _descr(descr):
+    # JSON turns the (name, format) tuples of a structured descr into lists
+    if isinstance(descr, list):
+        return np.dtype([tuple(field) for field in descr])
+    return np.dtype(descr)
+
+
+def read_version(path):
+    """Return the source version recorded in a compiled catalog header."""
+    return read_header(path)["version"]
+
+
+def read_header(path):
+    """The JSON header of a compiled catalog; "sources" is absent in old files."""
+    with open(path, "rb") as fh:
+        if fh.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a compiled catalog: %s" % path)
+        (length,) = struct.unpack("<I", fh.read(4))
+        return json.loads(fh.read(length))
+
+
+def load_compiled(path):
+    """Memory-map a compiled catalog; returns (version, {name: array})."""
+    header = read_header(path)
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        shape = tuple(entry["shape"])
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=_descr(entry["descr"]))
+            continue
+        arrays[name] = np.memmap(
+            path, dtype=_descr(entry["descr"]), mode="r", offset=entry["offset"], shape=shape
+        )
+    return header["version"], arrays
+
+
+def is_compiled(path):
+    return str(path).endswith(".spcat")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data_dir = argv[0] if argv else os.path.join(base_dir, "data")
+    output_path = argv[1] if len(argv) > 1 else None
+    path = compile_catalog(data_dir, output_path)
+    print("Compiled catalog written to:", path)
+
+
+if __name__ == "__main__":
+    main()
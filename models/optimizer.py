@@ -1,19 +1,222 @@
+import numpy as np
 import pandas as pd
 import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from utils import metrics
+from utils.carbon_calculator import CARDBOARD_DENSITY, material_factor
+from models.compiled_catalog import build_fit_index, is_compiled, load_compiled
+
+# selectable objectives; every one of them ranks boxes independently of the
+# product (waste = box volume - product volume), so rankings are precomputed
+OBJECTIVES = ("waste", "cost", "co2", "blend")
+DEFAULT_BLEND = {"waste": 1.0, "cost": 1.0, "co2": 1.0}
+# rows of the objective matrix (row 0 is volume, the waste rank key)
+_COST, _CO2 = 1, 2
+
 
 class SmartPackagingOptimizer:
 
-    def __init__(self, box_dataset_path):
+    def __init__(self, box_dataset_path=None, cache_size=4096, boxes=None, co2_factors=None):
+
+        if boxes is not None:
+            # in-memory catalog, e.g. a what-if candidate set
+            self._index_frame(boxes.reset_index(drop=True))
+        else:
+            # Make path absolute (safer)
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            full_path = os.path.join(base_dir, box_dataset_path)
+
+            print("Loading dataset from:", full_path)  # debug line
+
+            if is_compiled(full_path):
+                self._index_compiled(full_path)
+            else:
+                self._index_frame(pd.read_csv(full_path))
+
+        self._index_objectives(co2_factors or {})
+
+        # memoized results; the cache lives and dies with this catalog
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._blend_orders = {}
+
+    def _index_compiled(self, path):
+        # memory-mapped: the fit index is prebuilt and shared between
+        # processes through the page cache.  IDs and materials stay bytes in
+        # the mapping and are decoded only for the boxes a result names.
+        _, arrays = load_compiled(path)
+        self._box_records = arrays["boxes"]
+        self._boxes = None
+        self._fit_index = arrays["fit_index"]
+        self._fit_order = arrays["fit_order"]
+        self._id_order = arrays.get("id_order")
+        self._ids = self._box_records["box_id"]
+        self._materials = self._box_records["material_type"]
+        self._fit_costs = np.asarray(self._box_records["cost_per_box"][self._fit_order], dtype=np.float64)
+
+    def _index_frame(self, boxes):
+        self._box_records = None
+        self._boxes = boxes
+        self._fit_index, self._fit_order = build_fit_index(boxes)
+        self._id_order = None
+        self._ids = boxes["box_id"].astype(str).to_numpy(dtype=object)
+        self._materials = boxes["material_type"].astype(str).to_numpy(dtype=object)
+        self._fit_costs = boxes["cost_per_box"].to_numpy(dtype=np.float64)[self._fit_order]
+
+    def __len__(self):
+        return self._fit_index.shape[1]
+
+    def _box_id(self, pos):
+        return _text(self._ids[self._fit_order[pos]])
+
+    def _material(self, pos):
+        return _text(self._materials[self._fit_order[pos]])
+
+    def _fit_material_factors(self, co2_factors):
+        """CO2 factor per box in fit order, looked up once per distinct material."""
+        materials, codes = np.unique(self._materials, return_inverse=True)
+        factors = np.array([material_factor(co2_factors, _text(m)) for m in materials], dtype=np.float64)
+        return factors[codes.ravel()][self._fit_order] if len(codes) else np.zeros(0)
+
+    def _index_objectives(self, co2_factors):
+        """Precompute per-box objective values and rankings.
+
+        Without material factors CO2 falls back to board weight, which ranks
+        boxes like volume.
+        """
+        volume = np.asarray(self._fit_index[4], dtype=np.float64)
+        self._fit_co2 = volume * CARDBOARD_DENSITY * self._fit_material_factors(co2_factors)
+        # (3, n) matrix in fit (volume) order: waste rank key, cost, co2
+        values = np.vstack([volume, self._fit_costs, self._fit_co2])
+        self._objective_values = values
+        scale = values.max(axis=1, keepdims=True) if values.size else np.ones((3, 1))
+        self._normalized = values / np.where(scale > 0, scale, 1.0)
+
+        # per-objective rankings; stable sorts keep the smaller box first on ties
+        n = values.shape[1]
+        self._orders = {
+            "waste": np.arange(n),
+            "cost": np.argsort(values[_COST], kind="stable"),
+            "co2": np.argsort(values[_CO2], kind="stable"),
+        }
+
+    def _order_for(self, objective, blend):
+        if objective not in OBJECTIVES:
+            raise ValueError(f"objective must be one of {OBJECTIVES}")
+        if objective != "blend":
+            return self._orders[objective]
+        weights = {**DEFAULT_BLEND, **(blend or {})}
+        unknown = set(weights) - set(DEFAULT_BLEND)
+        if unknown:
+            raise ValueError(f"unknown blend weights: {sorted(unknown)}")
+        key = (weights["waste"], weights["cost"], weights["co2"])
+        order = self._blend_orders.get(key)
+        if order is None:
+            score = np.asarray(key) @ self._normalized
+            order = np.argsort(score, kind="stable")
+            # blend rankings are tiny; keep a handful around
+            if len(self._blend_orders) < 64:
+                self._blend_orders[key] = order
+        return order
+
+    def optimize(self, product_length, product_width, product_height, weight, fragile=False,
+                 objective="waste", blend=None, pareto=False):
+        """Pick the feasible box that is best under `objective`.
+
+        `objective` is waste (least empty space, the default), cost, co2 or
+        blend, a weighted sum of the three normalized objectives (`blend`
+        maps objective names to weights).  With `pareto=True` the result
+        also lists every feasible box not dominated on (waste, cost, co2).
+        """
+        blend_key = tuple(sorted(blend.items())) if blend else None
+        key = (product_length, product_width, product_height, weight, bool(fragile),
+               objective, blend_key, bool(pareto))
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        metrics.record_cache("optimizer", cached is not None)
+        if cached is not None:
+            return dict(cached)
 
-        # Make path absolute (safer)
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        full_path = os.path.join(base_dir, box_dataset_path)
+        result = self._optimize(product_length, product_width, product_height, weight, fragile,
+                                objective, blend, pareto)
 
-        print("Loading dataset from:", full_path)  # debug line
+        if self.cache_size:
+            with self._cache_lock:
+                self._cache[key] = result
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return dict(result)
 
-        self.boxes = pd.read_csv(full_path)
+    def lookup(self, box_ids, columns=("length_cm", "width_cm", "height_cm")):
+        """`columns` of the boxes named in `box_ids`, as a DataFrame with box_id.
 
-    def optimize(self, product_length, product_width, product_height, weight, fragile=False):
+        Unknown IDs are left out.  Compiled catalogs answer by binary search
+        on the mapped ID index, without materializing the box table.
+        """
+        wanted = list(dict.fromkeys(str(b) for b in box_ids))
+        if self._box_records is None:
+            table = self._boxes.assign(box_id=self._ids).drop_duplicates("box_id")
+            return table[table["box_id"].isin(wanted)][["box_id", *columns]].reset_index(drop=True)
+
+        if self._id_order is None:
+            # artifacts compiled before the ID index existed
+            self._id_order = np.argsort(self._ids, kind="stable")
+        ids, order, n = self._ids, self._id_order, len(self._ids)
+        rows = []
+        for box_id in wanted:
+            key = box_id.encode()
+            i = bisect_left(range(n), key, key=lambda j: bytes(ids[order[j]]))
+            if i < n and bytes(ids[order[i]]) == key:
+                rows.append(int(order[i]))
+        records = self._box_records[rows]
+        return pd.DataFrame({
+            "box_id": [_text(b) for b in records["box_id"]],
+            **{name: ([_text(v) for v in records[name]] if records.dtype[name].kind == "S"
+                      else np.asarray(records[name])) for name in columns},
+        })
+
+    @property
+    def boxes(self):
+        """Box table in file order (materialized lazily for compiled catalogs).
+
+        O(catalog) to build; request paths should use `lookup` or `len`.
+        """
+        if self._boxes is None:
+            records = self._box_records
+            self._boxes = pd.DataFrame({
+                name: (np.char.decode(records[name]) if records.dtype[name].kind == "S"
+                       else np.asarray(records[name]))
+                for name in records.dtype.names
+            })
+        return self._boxes
+
+    def _describe(self, pos, product_volume):
+        length, width, height, _, volume = self._fit_index
+        box_volume = float(volume[pos])
+        empty_space = box_volume - product_volume
+        waste_percentage = (empty_space / box_volume) * 100
+        return {
+            "selected_box": self._box_id(pos),
+            "box_dimensions": (
+                float(length[pos]),
+                float(width[pos]),
+                float(height[pos])
+            ),
+            "empty_space_cm3": round(empty_space, 2),
+            "waste_percentage": round(waste_percentage, 2),
+            "efficiency_score": round(100 - waste_percentage, 2),
+            "cost_per_box": float(self._fit_costs[pos]),
+            "material_type": self._material(pos),
+            "box_co2_kg": round(float(self._fit_co2[pos]), 4),
+        }
+
+    def _optimize(self, product_length, product_width, product_height, weight, fragile,
+                  objective="waste", blend=None, pareto=False):
 
         # Step 1: Add fragility buffer
         if fragile:
@@ -23,50 +226,127 @@ class SmartPackagingOptimizer:
 
         product_volume = product_length * product_width * product_height
 
-        best_box = None
-        minimum_empty_space = float('inf')
+        # Step 2: feasibility over the fit index (sorted by volume, so for
+        # the waste objective the first box that fits is the best one)
+        length, width, height, max_weight, volume = self._fit_index
+        fits = (
+            (product_length <= length) &
+            (product_width <= width) &
+            (product_height <= height) &
+            (weight <= max_weight)
+        )
+        order = self._order_for(objective, blend)
+        ranked = fits[order]
+        rank = int(ranked.argmax()) if len(ranked) else 0
+        if not len(ranked) or not ranked[rank]:
+            return {"error": "No suitable box found"}
 
-        for _, box in self.boxes.iterrows():
+        result = self._describe(int(order[rank]), product_volume)
+        result["objective"] = objective
 
-            # Check fit condition
-            if (
-                product_length <= box["length_cm"] and
-                product_width <= box["width_cm"] and
-                product_height <= box["height_cm"] and
-                weight <= box["max_weight_kg"]
-            ):
+        if pareto:
+            frontier = self._skyline(np.flatnonzero(fits))
+            result["pareto"] = [self._describe(int(pos), product_volume) for pos in frontier]
+        return result
 
-                box_volume = (
-                    box["length_cm"] *
-                    box["width_cm"] *
-                    box["height_cm"]
-                )
+    def _skyline(self, feasible):
+        """Fit positions among `feasible` not dominated on (waste, cost, co2).
 
-                empty_space = box_volume - product_volume
+        Boxes are swept in (volume, cost, co2) order, so anything that
+        dominates a box comes before it.  A staircase of the (cost, co2)
+        pairs seen so far, with co2 falling as cost rises, answers "is
+        there an earlier box at least as cheap and as clean" by binary
+        search.  For k feasible boxes that is O(k log k) comparisons, but
+        each staircase update shifts a Python list, so the worst case (a
+        staircase as long as k) is O(k^2) element moves.  Those are
+        memmoves, cheap in practice.
+        """
+        volume, cost, co2 = self._objective_values[:, feasible]
+        sweep = np.lexsort((co2, cost, volume))
+        stair_cost, stair_co2, stair_volume = [], [], []
+        frontier = []
+        for i in sweep.tolist():
+            v, c, e = volume[i], cost[i], co2[i]
+            pos = bisect_right(stair_cost, c) - 1
+            if pos >= 0:
+                # the cleanest earlier box among those no more expensive
+                best_co2 = stair_co2[pos]
+                if best_co2 < e or (best_co2 == e and (stair_cost[pos] < c or stair_volume[pos] < v)):
+                    continue
+                if best_co2 == e:
+                    # an identical box: both are on the frontier
+                    frontier.append(i)
+                    continue
+            frontier.append(i)
+            # i replaces the steps it covers: cost >= c with co2 >= e
+            insert = pos if pos >= 0 and stair_cost[pos] == c else pos + 1
+            stop = insert
+            while stop < len(stair_cost) and stair_co2[stop] >= e:
+                stop += 1
+            stair_cost[insert:stop] = [c]
+            stair_co2[insert:stop] = [e]
+            stair_volume[insert:stop] = [v]
+        return np.sort(feasible[frontier])
 
-                if empty_space < minimum_empty_space:
-                    minimum_empty_space = empty_space
-                    best_box = box
+    def optimize_batch(self, lengths, widths, heights, weights, fragile=False, chunk_size=65536,
+                       objective="waste", blend=None):
+        """Vectorized `optimize` over arrays of products.
 
-        if best_box is None:
-            return {"error": "No suitable box found"}
+        Returns a dict of arrays aligned with the inputs.  Products that fit
+        no box get `selected_box` None and NaN metrics.  Work is chunked so
+        the (products x boxes) fit mask stays bounded in memory.
+        """
+        lengths = np.asarray(lengths, dtype=np.float64)
+        widths = np.asarray(widths, dtype=np.float64)
+        heights = np.asarray(heights, dtype=np.float64)
+        weights = np.asarray(weights, dtype=np.float64)
+        buffer = np.where(np.asarray(fragile, dtype=bool), 2.0, 0.0)
+        lengths, widths, heights = lengths + buffer, widths + buffer, heights + buffer
 
-        waste_percentage = (minimum_empty_space / (
-            best_box["length_cm"] *
-            best_box["width_cm"] *
-            best_box["height_cm"]
-        )) * 100
+        n = len(lengths)
+        positions = np.full(n, -1, dtype=np.int64)
+        # columns permuted into objective rank order; first fit wins
+        order = self._order_for(objective, blend)
+        length, width, height, max_weight, volume = (row[order] for row in self._fit_index)
+        if len(volume):
+            for start in range(0, n, chunk_size):
+                end = min(start + chunk_size, n)
+                fits = (
+                    (lengths[start:end, None] <= length) &
+                    (widths[start:end, None] <= width) &
+                    (heights[start:end, None] <= height) &
+                    (weights[start:end, None] <= max_weight)
+                )
+                first = fits.argmax(axis=1)
+                found = fits[np.arange(end - start), first]
+                positions[start:end] = np.where(found, order[first], -1)
 
-        efficiency_score = 100 - waste_percentage
+        volume = self._fit_index[4]
+        found = positions >= 0
+        safe = np.where(found, positions, 0)
+        box_volume = np.where(found, volume[safe] if len(volume) else np.nan, np.nan)
+        empty_space = box_volume - lengths * widths * heights
+        waste_percentage = empty_space / box_volume * 100
 
+        # decode only the boxes that were picked
+        ids = np.full(n, None, dtype=object)
+        materials = np.full(n, None, dtype=object)
+        if found.any():
+            picked, inverse = np.unique(positions[found], return_inverse=True)
+            ids[found] = np.array([self._box_id(p) for p in picked], dtype=object)[inverse]
+            materials[found] = np.array([self._material(p) for p in picked], dtype=object)[inverse]
         return {
-            "selected_box": best_box["box_id"],
-            "box_dimensions": (
-                best_box["length_cm"],
-                best_box["width_cm"],
-                best_box["height_cm"]
-            ),
-            "empty_space_cm3": round(minimum_empty_space, 2),
-            "waste_percentage": round(waste_percentage, 2),
-            "efficiency_score": round(efficiency_score, 2)
-        }
\ No newline at end of file
+            "box_position": positions,
+            "selected_box": ids,
+            "box_volume": box_volume,
+            "empty_space_cm3": empty_space,
+            "waste_percentage": waste_percentage,
+            "cost_per_box": np.where(found, self._fit_costs[safe] if len(volume) else np.nan, np.nan),
+            "box_co2_kg": np.where(found, self._fit_co2[safe] if len(volume) else np.nan, np.nan),
+            "material_type": materials,
+        }
+
+
+def _text(value):
+    """A box ID or material from either backing store as str."""
+    return value.decode() if isinstance(value, bytes) else str(value)
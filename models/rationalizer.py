@@ -0,0 +1,289 @@
+# models/rationalizer.py
+
+"""Box-catalog rationalization: pick K box sizes that serve history best.
+
+Shipment history is deduplicated into weighted demand points (product
+dimensions, after the fragile buffer, rounded *up* to a grid so that any
+box fitting the rounded point also fits every product behind it).  The
+selection problem is then a weighted facility-location problem:
+
+    minimise  sum_p  w_p * min_{b in S, b fits p} cost(p, b)    with |S| = K
+
+where cost is the empty volume (`objective="volume"`) or the box price
+(`objective="cost"`).  Products no box in S can hold pay a penalty larger
+than any real cost.  The objective is monotone submodular in S, so greedy
+selection carries the usual (1 - 1/e) guarantee; the remaining time budget
+is spent on swap local search.  Each pass is a vectorized
+(demand x candidates) evaluation in slices of at most `SLICE_ELEMENTS`
+elements, spread across threads (NumPy releases the GIL), so the cost is
+driven by distinct demand points, not raw rows.
+
+Usage::
+
+    python -m models.rationalizer --k 5 [--objective cost] [--time-budget 60]
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from models.optimizer import SmartPackagingOptimizer
+
+OBJECTIVES = ("volume", "cost")
+# (demand x candidates) elements per evaluated slice; each pass keeps a few
+# float64 temporaries of this size per thread, ~8 MB apiece
+SLICE_ELEMENTS = 1 << 20
+
+
+def aggregate_demand(chunks, resolution=1.0, weight_resolution=0.5):
+    """Collapse shipment rows into weighted, deduplicated demand points.
+
+    `chunks` yields rows of (length, width, height, weight, fragile, ...)
+    such as `database.archive.iter_shipment_history()`.  Returns a
+    DataFrame with columns length, width, height, weight, count.
+    """
+    parts = []
+    pending = 0
+    for rows in chunks:
+        if not rows:
+            continue
+        data = np.asarray([r[:5] for r in rows], dtype=np.float64)
+        buffer = np.where(data[:, 4] > 0, 2.0, 0.0)
+        dims = np.ceil((data[:, :3] + buffer[:, None]) / resolution) * resolution
+        weight = np.ceil(data[:, 3] / weight_resolution) * weight_resolution
+        keys = np.column_stack([dims, weight])
+        uniq, counts = np.unique(keys, axis=0, return_counts=True)
+        parts.append((uniq, counts))
+        pending += len(uniq)
+        # re-deduplicate now and then so memory tracks distinct points
+        if pending > 2_000_000:
+            parts = [_combine(parts)]
+            pending = len(parts[0][0])
+    if not parts:
+        return pd.DataFrame(columns=["length", "width", "height", "weight", "count"])
+    keys, counts = _combine(parts)
+    frame = pd.DataFrame(keys, columns=["length", "width", "height", "weight"])
+    frame["count"] = counts
+    return frame
+
+
+def _combine(parts):
+    keys = np.concatenate([k for k, _ in parts])
+    counts = np.concatenate([c for _, c in parts])
+    uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+    return uniq, np.bincount(inverse.ravel(), weights=counts).astype(np.int64)
+
+
+class _Problem:
+
+    def __init__(self, demand, candidates, objective, workers):
+        self.dims = demand[["length", "width", "height"]].to_numpy(dtype=np.float64)
+        self.weight = demand["weight"].to_numpy(dtype=np.float64)
+        self.count = demand["count"].to_numpy(dtype=np.float64)
+        self.volume = self.dims.prod(axis=1)
+
+        self.box_dims = candidates[["length_cm", "width_cm", "height_cm"]].to_numpy(dtype=np.float64)
+        self.box_max_weight = candidates["max_weight_kg"].to_numpy(dtype=np.float64)
+        self.box_volume = self.box_dims.prod(axis=1)
+        self.box_cost = candidates["cost_per_box"].to_numpy(dtype=np.float64)
+        self.objective = objective
+
+        worst = self.box_volume.max() if objective == "volume" else self.box_cost.max()
+        self.penalty = 2.0 * float(worst) + 1.0
+        self.workers = max(1, workers)
+        n = len(self.count)
+        # at least one slice per worker, and none over the element budget,
+        # so memory stays flat however much history there is
+        rows = max(1, SLICE_ELEMENTS // max(1, len(self.box_volume)))
+        step = max(1, min(-(-n // self.workers), rows))
+        self.slices = [slice(i, min(i + step, n)) for i in range(0, n, step)]
+        self._pool = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def _map(self, fn):
+        if self._pool is None:
+            return [fn(s) for s in self.slices]
+        return list(self._pool.map(fn, self.slices))
+
+    def _cost(self, part, boxes):
+        """(demand slice x boxes) cost matrix, inf where the box doesn't fit."""
+        dims = self.dims[part]
+        fits = (
+            (dims[:, 0:1] <= self.box_dims[boxes, 0]) &
+            (dims[:, 1:2] <= self.box_dims[boxes, 1]) &
+            (dims[:, 2:3] <= self.box_dims[boxes, 2]) &
+            (self.weight[part, None] <= self.box_max_weight[boxes])
+        )
+        if self.objective == "volume":
+            cost = self.box_volume[boxes] - self.volume[part, None]
+        else:
+            cost = np.broadcast_to(self.box_cost[boxes], fits.shape)
+        return np.where(fits, cost, np.inf)
+
+    def assigned_cost(self, selected):
+        """Per-demand-point cost under `selected` (penalty if nothing fits)."""
+        if not len(selected):
+            return np.full(len(self.count), self.penalty)
+        boxes = np.asarray(selected)
+
+        def work(part):
+            return np.minimum(self._cost(part, boxes).min(axis=1), self.penalty)
+
+        return np.concatenate(self._map(work))
+
+    def gains(self, current):
+        """Weighted improvement from adding each candidate to the set."""
+        boxes = np.arange(len(self.box_volume))
+
+        def work(part):
+            cost = self._cost(part, boxes)
+            improvement = np.maximum(current[part, None] - cost, 0.0)
+            return (improvement * self.count[part, None]).sum(axis=0)
+
+        return np.sum(self._map(work), axis=0)
+
+    def total(self, current):
+        return float((current * self.count).sum())
+
+
+def rationalize(demand, candidates, k, objective="volume", time_budget=60.0, workers=None):
+    """Choose `k` boxes from `candidates` minimising total objective over `demand`.
+
+    `demand` comes from `aggregate_demand`; `candidates` is a box table
+    shaped like boxes.csv.  Both phases respect `time_budget`: greedy
+    selection that runs out of time returns the boxes picked so far (at
+    least one) with `truncated` set, and swap refinement stops when it
+    converges or time is up.  Returns a report with the chosen boxes and
+    their coverage.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}")
+    candidates = candidates.drop_duplicates(
+        subset=["length_cm", "width_cm", "height_cm", "max_weight_kg", "cost_per_box"]
+    ).reset_index(drop=True)
+    k = min(k, len(candidates))
+    if k <= 0 or demand.empty:
+        raise ValueError("need k >= 1, at least one candidate and some shipment history")
+
+    start = time.perf_counter()
+    deadline = start + time_budget
+    problem = _Problem(demand, candidates, objective, workers or os.cpu_count() or 1)
+    try:
+        # greedy: add the candidate with the largest weighted improvement
+        selected = []
+        current = problem.assigned_cost(selected)
+        truncated = False
+        for _ in range(k):
+            if selected and time.perf_counter() >= deadline:
+                truncated = True
+                break
+            gains = problem.gains(current)
+            gains[selected] = -1.0
+            best = int(gains.argmax())
+            selected.append(best)
+            current = np.minimum(current, problem.assigned_cost([best]))
+        greedy_total = problem.total(current)
+
+        # swap local search: replace one chosen box with the best outsider
+        # while it strictly lowers the total
+        swaps = 0
+        timed_out = truncated
+        improved = not truncated
+        while improved:
+            improved = False
+            for i in range(len(selected)):
+                if time.perf_counter() >= deadline:
+                    timed_out = True
+                    break
+                rest = selected[:i] + selected[i + 1:]
+                base = problem.assigned_cost(rest)
+                gains = problem.gains(base)
+                gains[selected] = -1.0
+                best = int(gains.argmax())
+                new_total = problem.total(base) - gains[best]
+                if new_total < problem.total(current) - 1e-9:
+                    selected[i] = best
+                    current = np.minimum(base, problem.assigned_cost([best]))
+                    swaps += 1
+                    improved = True
+            if timed_out:
+                break
+    finally:
+        problem.close()
+
+    chosen = candidates.iloc[sorted(selected, key=lambda c: problem.box_volume[c])]
+    return {
+        "k": k,
+        "selected": len(selected),
+        "truncated": truncated,
+        "objective": objective,
+        "boxes": chosen.to_dict(orient="records"),
+        **evaluate_catalog(demand, chosen, objective),
+        "greedy_total": round(greedy_total, 2),
+        "swaps": swaps,
+        "timed_out": timed_out,
+        "elapsed_seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def evaluate_catalog(demand, boxes, objective="volume"):
+    """Score a box table on weighted demand using the live optimizer.
+
+    The optimizer selects with the matching objective (waste for
+    "volume", cost for "cost"), as /optimize would.
+    """
+    optimizer = SmartPackagingOptimizer(boxes=boxes, cache_size=0)
+    result = optimizer.optimize_batch(
+        demand["length"], demand["width"], demand["height"], demand["weight"],
+        objective="cost" if objective == "cost" else "waste",
+    )
+    count = demand["count"].to_numpy(dtype=np.float64)
+    found = result["box_position"] >= 0
+    packed = count[found]
+    empty = float((result["empty_space_cm3"][found] * packed).sum())
+    box_volume = float((result["box_volume"][found] * packed).sum())
+    usage = (
+        pd.Series(packed, index=result["selected_box"][found].astype(str))
+        .groupby(level=0).sum().astype(int).to_dict()
+    )
+    return {
+        "shipments": int(count.sum()),
+        "unpackable_shipments": int(count[~found].sum()),
+        "empty_volume_cm3": round(empty, 2),
+        "waste_percentage": round(empty / box_volume * 100, 2) if box_volume else None,
+        "box_cost": round(float((result["cost_per_box"][found] * packed).sum()), 2),
+        "usage": usage,
+    }
+
+
+def main(argv=None):
+    from database.archive import iter_shipment_history
+
+    parser = argparse.ArgumentParser(description="Choose the best K box sizes from shipment history.")
+    parser.add_argument("--k", type=int, required=True)
+    parser.add_argument("--objective", choices=OBJECTIVES, default="volume")
+    parser.add_argument("--candidates", help="CSV of candidate boxes (default: data/boxes.csv)")
+    parser.add_argument("--time-budget", type=float, default=60.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--resolution", type=float, default=1.0, help="dimension grid in cm")
+    args = parser.parse_args(argv)
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    current = pd.read_csv(os.path.join(base_dir, "data", "boxes.csv"))
+    candidates = pd.read_csv(args.candidates) if args.candidates else current
+    demand = aggregate_demand(iter_shipment_history(), resolution=args.resolution)
+    report = rationalize(demand, candidates, args.k, args.objective, args.time_budget, args.workers)
+    report["current_catalog"] = evaluate_catalog(demand, current, args.objective)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# models/simulator.py
+
+"""What-if replay of shipment history against a candidate box catalog.
+
+The simulation is read-only: it streams `(dims, weight, fragile,
+selected_box)` rows from the shipments table in chunks, runs each chunk
+through `SmartPackagingOptimizer.optimize_batch` for the candidate
+catalog and compares empty volume, box cost and box CO2 against the boxes
+that were actually used.  Chunks can be spread over worker processes;
+each chunk reduces to a handful of sums, so merging is trivial.
+
+Usage::
+
+    python -m models.simulator candidate_boxes.csv [--workers 4] [--chunk-size 200000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from models.optimizer import SmartPackagingOptimizer
+from utils.carbon_calculator import CARDBOARD_DENSITY, DEFAULT_MATERIAL
+
+_SUM_FIELDS = ("empty_volume_cm3", "box_volume_cm3", "cost", "co2_kg")
+
+# per-process state for pool workers
+_worker = None
+
+
+class _Replayer:
+    """Evaluates chunks; built once per process."""
+
+    def __init__(self, candidate_boxes, current_boxes, co2_factors):
+        self.candidate = SmartPackagingOptimizer(boxes=candidate_boxes, cache_size=0)
+        self.co2_factors = co2_factors
+        default_factor = co2_factors.get(DEFAULT_MATERIAL, 0.0)
+        current = current_boxes.set_index(current_boxes["box_id"].astype(str))
+        volume = current["length_cm"] * current["width_cm"] * current["height_cm"]
+        factors = current["material_type"].map(co2_factors).fillna(default_factor)
+        # box_id -> (volume, cost, co2 of one box) for the boxes actually used
+        self.current_index = pd.Index(current.index)
+        self.current_volume = volume.to_numpy(dtype=np.float64)
+        self.current_cost = current["cost_per_box"].to_numpy(dtype=np.float64)
+        self.current_co2 = (volume * CARDBOARD_DENSITY * factors).to_numpy(dtype=np.float64)
+        self.default_factor = default_factor
+
+    def evaluate(self, chunk):
+        length, width, height, weight, fragile, selected = chunk
+        fragile = np.asarray(fragile, dtype=bool)
+        buffer = np.where(fragile, 2.0, 0.0)
+        product_volume = (length + buffer) * (width + buffer) * (height + buffer)
+
+        cand = self.candidate.optimize_batch(length, width, height, weight, fragile)
+        cand_found = cand["box_position"] >= 0
+        cand_factor = (
+            pd.Series(cand["material_type"], dtype=object)
+            .map(self.co2_factors).fillna(self.default_factor).to_numpy(dtype=np.float64)
+        )
+        cand_co2 = cand["box_volume"] * CARDBOARD_DENSITY * cand_factor
+
+        codes = self.current_index.get_indexer(pd.Index(selected))
+        actual_known = codes >= 0
+        safe = np.where(actual_known, codes, 0)
+
+        both = cand_found & actual_known
+        actual_volume = self.current_volume[safe][both]
+        out = {
+            "rows": int(len(length)),
+            "compared": int(both.sum()),
+            "unfit_candidate": int((~cand_found).sum()),
+            "unknown_actual": int((~actual_known).sum()),
+            "actual": {
+                "empty_volume_cm3": float((actual_volume - product_volume[both]).sum()),
+                "box_volume_cm3": float(actual_volume.sum()),
+                "cost": float(self.current_cost[safe][both].sum()),
+                "co2_kg": float(self.current_co2[safe][both].sum()),
+            },
+            "candidate": {
+                "empty_volume_cm3": float(cand["empty_space_cm3"][both].sum()),
+                "box_volume_cm3": float(cand["box_volume"][both].sum()),
+                "cost": float(cand["cost_per_box"][both].sum()),
+                "co2_kg": float(cand_co2[both].sum()),
+            },
+        }
+        ids, counts = np.unique(cand["selected_box"][cand_found].astype(str), return_counts=True)
+        out["candidate_usage"] = dict(zip(ids.tolist(), counts.tolist()))
+        return out
+
+
+def _init_worker(candidate_boxes, current_boxes, co2_factors):
+    global _worker
+    _worker = _Replayer(candidate_boxes, current_boxes, co2_factors)
+
+
+def _evaluate_in_worker(chunk):
+    return _worker.evaluate(chunk)
+
+
+def _to_arrays(rows):
+    """Turn DB rows (l, w, h, weight, fragile, selected_box) into arrays."""
+    if not rows:
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty, empty, empty, np.empty(0, dtype=bool), np.empty(0, dtype=object)
+    l, w, h, wt, fr, sel = zip(*rows)
+    return (
+        np.asarray(l, dtype=np.float64),
+        np.asarray(w, dtype=np.float64),
+        np.asarray(h, dtype=np.float64),
+        np.asarray(wt, dtype=np.float64),
+        np.asarray([bool(x) for x in fr], dtype=bool),
+        np.asarray(sel, dtype=object),
+    )
+
+
+def _empty_totals():
+    return {
+        "rows": 0, "compared": 0, "unfit_candidate": 0, "unknown_actual": 0,
+        "actual": dict.fromkeys(_SUM_FIELDS, 0.0),
+        "candidate": dict.fromkeys(_SUM_FIELDS, 0.0),
+        "candidate_usage": {},
+    }
+
+
+def _merge(totals, part):
+    for key in ("rows", "compared", "unfit_candidate", "unknown_actual"):
+        totals[key] += part[key]
+    for side in ("actual", "candidate"):
+        for field in _SUM_FIELDS:
+            totals[side][field] += part[side][field]
+    usage = totals["candidate_usage"]
+    for box, n in part["candidate_usage"].items():
+        usage[box] = usage.get(box, 0) + n
+
+
+def _report(totals, elapsed):
+    actual, cand = totals["actual"], totals["candidate"]
+
+    def waste_pct(side):
+        return round(side["empty_volume_cm3"] / side["box_volume_cm3"] * 100, 2) \
+            if side["box_volume_cm3"] else None
+
+    delta = {field: round(cand[field] - actual[field], 4) for field in _SUM_FIELDS}
+    return {
+        "rows": totals["rows"],
+        "compared": totals["compared"],
+        "unfit_candidate": totals["unfit_candidate"],
+        "unknown_actual": totals["unknown_actual"],
+        "actual": {**{k: round(v, 4) for k, v in actual.items()}, "waste_percentage": waste_pct(actual)},
+        "candidate": {**{k: round(v, 4) for k, v in cand.items()}, "waste_percentage": waste_pct(cand)},
+        "delta": delta,
+        "candidate_usage": dict(sorted(totals["candidate_usage"].items())),
+        "elapsed_seconds": round(elapsed, 2),
+    }
+
+
+def simulate_catalog(candidate_boxes, current_boxes, co2_factors, chunks, workers=0):
+    """Replay `chunks` of shipment rows through a candidate catalog.
+
+    `candidate_boxes` and `current_boxes` are box tables shaped like
+    boxes.csv; `chunks` is an iterable of row lists such as
+    `database.archive.iter_shipment_history()`.  With `workers` > 1 the
+    chunks are evaluated in a process pool while the next ones are being
+    fetched.
+    Pool workers are spawned, not forked, so callers may be multithreaded.
+    Rows the candidate cannot pack, or whose recorded box is no longer in
+    the current catalog, are counted but left out of the comparison.
+    """
+    start = time.perf_counter()
+    totals = _empty_totals()
+
+    if workers and workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            # forking a multithreaded server can copy locks held by other threads
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(candidate_boxes, current_boxes, co2_factors),
+        ) as pool:
+            # bound the number of chunks held in memory at once
+            pending = []
+            for rows in chunks:
+                pending.append(pool.submit(_evaluate_in_worker, _to_arrays(rows)))
+                if len(pending) >= workers * 2:
+                    _merge(totals, pending.pop(0).result())
+            for future in pending:
+                _merge(totals, future.result())
+    else:
+        replayer = _Replayer(candidate_boxes, current_boxes, co2_factors)
+        for rows in chunks:
+            _merge(totals, replayer.evaluate(_to_arrays(rows)))
+
+    return _report(totals, time.perf_counter() - start)
+
+
+def main(argv=None):
+    from database.archive import iter_shipment_history
+    from models.catalog import CatalogManager
+
+    parser = argparse.ArgumentParser(
+        description="Replay shipment history against a candidate box catalog (read-only)."
+    )
+    parser.add_argument("candidate", help="CSV of candidate boxes, same columns as boxes.csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=200000)
+    args = parser.parse_args(argv)
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    current = CatalogManager(os.path.join(base_dir, "data"), poll_interval=0).current
+    report = simulate_catalog(
+        pd.read_csv(args.candidate),
+        current.boxes,
+        current.carbon_calc.co2_factors,
+        iter_shipment_history(chunk_size=args.chunk_size),
+        workers=args.workers,
+    )
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# tests/test_archive.py
+
+"""Hot/cold tiering on a temporary SQLite database and archive directory."""
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from database import archive, db, versions
+from database.sqlite_backend import SQLiteBackend
+from database.storage import set_backend
+
+BOXES = ("S", "M", "L")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A SQLite backend holding 60 shipments, one every two days, plus its archive dir."""
+    monkeypatch.setattr(versions, "_counters", versions._MemoryCounters())
+    monkeypatch.setenv("ARCHIVE_DIR", str(tmp_path / "archive"))
+    backend = SQLiteBackend(path=str(tmp_path / "smartpack.sqlite3"))
+    previous = set_backend(backend)
+    db.initialize_db()
+    now = datetime.now().replace(microsecond=0)
+    for i in range(60):
+        db.insert_shipment({
+            "product_length": 10.0, "product_width": 8.0, "product_height": 4.0,
+            "weight": 1.0, "fragile": i % 2 == 0, "selected_box": BOXES[i % 3],
+            "waste_percentage": 10.0, "co2_saved": float(i), "cost_saved": 1.0,
+            "sustainability_score": 5.0,
+        })
+        backend._write("UPDATE shipments SET created_at = ? WHERE id = ?",
+                       ((now - timedelta(days=2 * (60 - i))).strftime("%Y-%m-%d %H:%M:%S"), i + 1))
+    yield now
+    set_backend(previous)
+    backend.close()
+
+
+def _totals():
+    first, last, count = archive.history_time_range()
+    summary = archive.shipment_summary()
+    return {
+        "range": (first, last, count),
+        "weekly": int(archive.weekly_box_counts().to_numpy().sum()),
+        "summary": (summary["shipments"], summary["totals"]["co2_saved"], summary["by_box"]),
+        "history": sum(len(chunk) for chunk in archive.iter_shipment_history()),
+        "series": sum(len(values) for _, values in archive.iter_history_series("co2_saved")),
+        "buckets": [
+            (sum(row[3] for row in rows), round(sum(row[1] for row in rows), 6))
+            for rows in (archive.history_buckets("co2_saved", 3600),
+                         archive.history_buckets("co2_saved", 14 * 24 * 3600))
+        ],
+    }
+
+
+def _expected(now):
+    return {
+        "range": (now - timedelta(days=120), now - timedelta(days=2), 60),
+        "weekly": 60,
+        "summary": (60, float(sum(range(60))), {box: 20 for box in BOXES}),
+        "history": 60,
+        "series": 60,
+        "buckets": [(60, float(sum(range(60))))] * 2,
+    }
+
+
+def test_archive_moves_rows_and_readers_see_both_tiers(store):
+    now = store
+    report = archive.archive_shipments(now - timedelta(days=30))
+    assert report["archived"] == report["deleted"] == 45
+    assert len(db.get_shipments()) == 15
+    assert _totals() == _expected(now)
+    assert archive.high_water_mark() == (45, now - timedelta(days=30))
+
+
+def test_shipment_history_limit(store):
+    now = store
+    archive.archive_shipments(now - timedelta(days=30))
+    rows = archive.shipment_history(limit=20)
+    assert [row["co2_saved"] for row in rows] == [float(i) for i in range(40, 60)]
+    assert all(isinstance(row["created_at"], datetime) for row in rows)
+    assert len(archive.shipment_history()) == 60
+
+
+def test_read_archive_window(store):
+    now = store
+    archive.archive_shipments(now - timedelta(days=30))
+    frame = archive.read_archive(["co2_saved"], start=now - timedelta(days=60),
+                                 end=now - timedelta(days=40))
+    assert sorted(frame["co2_saved"]) == [float(i) for i in range(30, 40)]
+
+
+def test_crash_before_delete_is_not_double_counted(store, monkeypatch):
+    now = store
+    delete = archive.delete_shipments
+
+    def crash(max_id, before):
+        raise RuntimeError("killed")
+
+    monkeypatch.setattr(archive, "delete_shipments", crash)
+    with pytest.raises(RuntimeError):
+        archive.archive_shipments(now - timedelta(days=30))
+    # committed to the archive but still in the hot table
+    assert len(db.get_shipments()) == 60
+    assert _totals() == _expected(now)
+
+    monkeypatch.setattr(archive, "delete_shipments", delete)
+    report = archive.archive_shipments(now - timedelta(days=30))
+    assert report["archived"] == 0
+    assert report["deleted"] == 45
+    assert _totals() == _expected(now)
+
+
+def test_crash_before_commit_is_not_double_counted(store, monkeypatch):
+    now = store
+    commit = archive._commit
+
+    def crash(directory, months, mark):
+        raise RuntimeError("killed")
+
+    monkeypatch.setattr(archive, "_commit", crash)
+    with pytest.raises(RuntimeError):
+        archive.archive_shipments(now - timedelta(days=30))
+    assert archive.archive_version() is None
+    assert _totals() == _expected(now)
+
+    monkeypatch.setattr(archive, "_commit", commit)
+    report = archive.archive_shipments(now - timedelta(days=30))
+    # the rerun copies the rows again; readers drop the duplicates
+    assert report["archived"] == report["deleted"] == 45
+    assert _totals() == _expected(now)
+
+
+def test_later_runs_extend_the_mark(store):
+    now = store
+    archive.archive_shipments(now - timedelta(days=60))
+    archive.archive_shipments(now - timedelta(days=30))
+    assert archive.high_water_mark() == (45, now - timedelta(days=30))
+    assert len(db.get_shipments()) == 15
+    assert _totals() == _expected(now)
+
+
+def test_week_buckets_start_inside_the_history(store):
+    now = store
+    archive.archive_shipments(now - timedelta(days=30))
+    first, last, _ = archive.history_time_range()
+    for days in (7, 14, 30):
+        size = days * 24 * 3600
+        rows = archive.history_buckets("co2_saved", size)
+        lowest = archive._bucket(pd.Series([first]), size)[0]
+        assert rows[0][0] >= lowest
+        assert rows[-1][0] <= last
+        assert sum(row[3] for row in rows) == 60
+
+
+def test_bucket_series_has_at_most_the_requested_points(store):
+    from fastapi.testclient import TestClient
+    from backend.app import app
+
+    now = store
+    archive.archive_shipments(now - timedelta(days=30))
+    client = TestClient(app)
+    for points in (3, 7, 10, 59):
+        body = client.get("/shipments/series", params={"method": "bucket", "points": points}).json()
+        assert len(body["series"]) <= points
+        assert sum(row["count"] for row in body["series"]) == 60
@@ -0,0 +1,189 @@
+# tests/test_storage.py
+
+"""database.db against every storage backend.
+
+SQLite runs on a temporary file.  MySQL runs against the server in
+DB_HOST/DB_USER/... and is skipped when it cannot be reached; like the
+app's own startup, it recreates the shipments table.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db, versions
+from database.storage import IntegrityError, set_backend
+
+SHIPMENT = {
+    "product_length": 10.0,
+    "product_width": 8.0,
+    "product_height": 4.0,
+    "weight": 1.5,
+    "fragile": False,
+    "selected_box": "B1",
+    "waste_percentage": 20.0,
+    "co2_saved": 0.5,
+    "cost_saved": 0.25,
+    "sustainability_score": 5.0,
+}
+
+
+def _sqlite(tmp_path):
+    from database.sqlite_backend import SQLiteBackend
+    return SQLiteBackend(path=str(tmp_path / "smartpack.sqlite3"))
+
+
+def _mysql(tmp_path):
+    connector = pytest.importorskip("mysql.connector")
+    from database.mysql_backend import MySQLBackend
+    try:
+        db.get_connection().close()
+    except connector.Error as e:
+        pytest.skip(f"MySQL unreachable: {e}")
+    return MySQLBackend()
+
+
+@pytest.fixture(params=["sqlite", "mysql"])
+def storage(request, tmp_path, monkeypatch):
+    """A backend installed as the process-wide backend."""
+    backend = (_sqlite if request.param == "sqlite" else _mysql)(tmp_path)
+    # keep version bumps away from the shared counter file
+    monkeypatch.setattr(versions, "_counters",
+                        backend.version_counters() or versions._MemoryCounters())
+    previous = set_backend(backend)
+    db.initialize_db()
+    yield backend
+    set_backend(previous)
+    backend.close()
+
+
+def _insert(n, **changes):
+    for i in range(n):
+        db.insert_shipment({**SHIPMENT, "co2_saved": float(i), **changes})
+
+
+def test_insert_and_get_shipments(storage):
+    _insert(3, fragile=True)
+    rows = db.get_shipments()
+    assert len(rows) == 3
+    assert [row["co2_saved"] for row in rows] == [0.0, 1.0, 2.0]
+    assert all(row["selected_box"] == "B1" and row["fragile"] for row in rows)
+    assert all(isinstance(row["created_at"], datetime) for row in rows)
+
+
+def test_inventory_upsert_with_negative_change(storage):
+    db.adjust_inventory("B1", 5)
+    db.adjust_inventory("B1", -2, record_use=True)
+    db.adjust_inventory("B2", -1, record_use=True)
+    stock = {row["box_size"]: (row["stock"], row["usage_count"]) for row in db.get_inventory()}
+    assert stock["B1"] == (3, 1)
+    assert stock["B2"] == (-1, 1)
+
+
+def test_package_lifecycle(storage):
+    db.adjust_inventory("B1", 1)
+    db.create_reusable_package("qr-1", "B1")
+    db.scan_reusable_package("qr-1")
+    db.scan_reusable_package("qr-1")
+    db.update_package_condition("qr-1", "fair")
+    (package,) = db.get_reusable_packages()
+    assert package["qr_id"] == "qr-1"
+    assert package["box_size"] == "B1"
+    assert package["reuse_count"] == 2
+    assert package["package_condition"] == "fair"
+    assert package["last_used_date"] is not None
+
+
+def test_package_for_unknown_box_is_rejected(storage):
+    with pytest.raises(IntegrityError):
+        db.create_reusable_package("qr-1", "missing")
+    assert db.get_reusable_packages() == []
+
+
+def test_failed_write_releases_the_write_lock(storage):
+    if storage.name != "sqlite":
+        pytest.skip("SQLite-only: one shared connection holds the lock")
+    with pytest.raises(IntegrityError):
+        db.create_reusable_package("qr-1", "missing")
+    other = storage._connect()
+    other.execute("PRAGMA busy_timeout=0")
+    other.execute("INSERT INTO inventory (box_size, stock, usage_count) VALUES ('B9', 1, 0)")
+    other.commit()
+    other.close()
+
+
+def test_failed_write_keeps_the_rest_of_its_batch(tmp_path, monkeypatch):
+    from database.sqlite_backend import SQLiteBackend
+
+    monkeypatch.setattr(versions, "_counters", versions._MemoryCounters())
+    backend = SQLiteBackend(path=str(tmp_path / "batched.sqlite3"), commit_interval=60)
+    previous = set_backend(backend)
+    try:
+        db.initialize_db()
+        db.adjust_inventory("B1", 1)
+        with pytest.raises(IntegrityError):
+            db.create_reusable_package("qr-1", "missing")
+        db.create_reusable_package("qr-2", "B1")
+        backend.flush()
+        assert [row["qr_id"] for row in db.get_reusable_packages()] == ["qr-2"]
+        assert [row["box_size"] for row in db.get_inventory()] == ["B1"]
+    finally:
+        set_backend(previous)
+        backend.close()
+
+
+def test_package_for_unknown_box_returns_422(storage):
+    from fastapi.testclient import TestClient
+    from backend.app import app
+
+    client = TestClient(app)
+    assert client.post("/reusable/create", params={"box_size": "missing"}).status_code == 422
+    db.adjust_inventory("B1", 1)
+    assert client.post("/reusable/create", params={"box_size": "B1"}).status_code == 200
+
+
+def test_iter_shipments_before(storage):
+    _insert(5)
+    now = datetime.now()
+    chunks = list(db.iter_shipments(("id", "co2_saved"), chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    ids = [row[0] for chunk in chunks for row in chunk]
+    assert ids == sorted(ids)
+    after = list(db.iter_shipments(("id",), chunk_size=10, before=now + timedelta(days=1)))
+    assert sum(len(chunk) for chunk in after) == 5
+    assert list(db.iter_shipments(("id",), chunk_size=10, before=now - timedelta(days=1))) == []
+    with pytest.raises(ValueError):
+        list(db.iter_shipments(("id", "password")))
+
+
+def test_delete_shipments(storage):
+    _insert(4)
+    ids = [row["id"] for row in db.get_shipments()]
+    now = datetime.now()
+    assert db.delete_shipments(ids[1], now - timedelta(days=1)) == 0
+    assert db.delete_shipments(ids[1], now + timedelta(days=1)) == 2
+    assert [row["id"] for row in db.get_shipments()] == ids[2:]
+
+
+def test_buckets_and_time_range(storage):
+    assert db.get_shipment_time_range() == (None, None, 0)
+    _insert(4)
+    first, last, count = db.get_shipment_time_range()
+    assert count == 4
+    assert first <= last
+    buckets = db.get_shipment_buckets("co2_saved", 24 * 3600)
+    assert sum(row[1] for row in buckets) == pytest.approx(6.0)
+    assert sum(row[3] for row in buckets) == 4
+    assert all(isinstance(row[0], datetime) for row in buckets)
+    series = db.get_shipment_series("co2_saved")
+    assert [value for _, value in series] == [0.0, 1.0, 2.0, 3.0]
+    with pytest.raises(ValueError):
+        db.get_shipment_buckets("weight; DROP TABLE shipments", 60)
+
+
+def test_writes_bump_data_versions(storage):
+    before = versions.current("shipments", "inventory")
+    _insert(1)
+    db.adjust_inventory("B1", 1)
+    after = versions.current("shipments", "inventory")
+    assert after == (before[0] + 1, before[1] + 1)
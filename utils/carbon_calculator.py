@@ -1,40 +1,154 @@
 # utils/carbon_calculator.py
 
+import os
+
+import numpy as np
 import pandas as pd
 
+from models.compiled_catalog import is_compiled, load_compiled
+
+# Approximate cardboard weight
+CARDBOARD_DENSITY = 0.0007  # kg per cubic cm
+# the packaging products ship in today is assumed to be plain cardboard
+DEFAULT_MATERIAL = "cardboard"
+# baseline used when a product has no (known) category
+OVERSIZE_FACTOR = 1.5
+
+
+def material_factor(co2_factors, material):
+    """CO2 per kg for `material`; unknown materials count as cardboard."""
+    return co2_factors.get(material, co2_factors.get(DEFAULT_MATERIAL, 1.0))
+
+
+def _records_frame(records):
+    return pd.DataFrame({
+        name: (np.char.decode(records[name]) if records.dtype[name].kind == "S"
+               else np.asarray(records[name]))
+        for name in records.dtype.names
+    })
+
+
 class CarbonCalculator:
 
-    def __init__(self, material_dataset_path):
-        self.material_data = pd.read_csv(material_dataset_path)
+    def __init__(self, material_dataset_path, default_packaging_path=None):
+        if is_compiled(material_dataset_path):
+            _, arrays = load_compiled(material_dataset_path)
+            self.material_data = _records_frame(arrays["materials"])
+            defaults = _records_frame(arrays["defaults"])
+        else:
+            self.material_data = pd.read_csv(material_dataset_path)
+            if default_packaging_path is None:
+                default_packaging_path = os.path.join(
+                    os.path.dirname(material_dataset_path), "default_packaging.csv"
+                )
+            if os.path.exists(default_packaging_path):
+                defaults = pd.read_csv(default_packaging_path)
+            else:
+                defaults = None
 
-    def calculate(self, optimized_box, default_box_volume, optimized_box_volume):
+        # factor lookup done once instead of filtering the frame per call
+        self.co2_factors = dict(zip(
+            self.material_data["material_type"],
+            self.material_data["co2_per_kg_kg"].astype(float),
+        ))
+
+        # category -> default box volume, precomputed for both the single
+        # and the batch path
+        if defaults is not None and not defaults.empty:
+            volumes = (
+                defaults["default_box_length"].astype(float)
+                * defaults["default_box_width"].astype(float)
+                * defaults["default_box_height"].astype(float)
+            )
+            self.baselines = dict(zip(defaults["product_category"].astype(str), volumes))
+        else:
+            self.baselines = {}
+        self._baseline_categories = pd.Index(list(self.baselines))
+        self._baseline_volumes = np.array(list(self.baselines.values()), dtype=np.float64)
 
-        # Approximate cardboard weight
-        cardboard_density = 0.0007  # kg per cubic cm
+    def default_box_volume(self, category, optimized_box_volume):
+        """Volume of the box the product would ship in without optimization."""
+        if category is not None and category in self.baselines:
+            return self.baselines[category]
+        return optimized_box_volume * OVERSIZE_FACTOR
 
-        default_weight = default_box_volume * cardboard_density
-        optimized_weight = optimized_box_volume * cardboard_density
+    def analyze(self, optimization, category=None):
+        """Carbon/cost analysis for an `optimize()` result."""
+        length, width, height = optimization["box_dimensions"]
+        optimized_volume = length * width * height
+        result = self.calculate(
+            optimized_box={
+                "cost_per_box": optimization["cost_per_box"],
+                "material_type": optimization.get("material_type", DEFAULT_MATERIAL),
+            },
+            default_box_volume=self.default_box_volume(category, optimized_volume),
+            optimized_box_volume=optimized_volume,
+        )
+        result["baseline"] = "category" if category in self.baselines else "oversize"
+        return result
+
+    def calculate(self, optimized_box, default_box_volume, optimized_box_volume):
+
+        default_weight = default_box_volume * CARDBOARD_DENSITY
+        optimized_weight = optimized_box_volume * CARDBOARD_DENSITY
 
         weight_saved = default_weight - optimized_weight
 
-        # Get CO2 factor for cardboard
-        co2_factor = self.material_data[
-            self.material_data["material_type"] == "cardboard"
-        ]["co2_per_kg_kg"].values[0]
+        # default packaging is cardboard; the chosen box uses its own material
+        default_factor = self.co2_factors[DEFAULT_MATERIAL]
+        optimized_factor = material_factor(
+            self.co2_factors, optimized_box.get("material_type", DEFAULT_MATERIAL)
+        )
 
-        co2_saved = weight_saved * co2_factor
+        co2_saved = default_weight * default_factor - optimized_weight * optimized_factor
 
-        # Cost difference
-        default_cost = optimized_box["cost_per_box"] * 1.5  # simulate oversized
+        # Cost difference: box cost scales with board used, i.e. volume
         optimized_cost = optimized_box["cost_per_box"]
+        default_cost = optimized_cost * default_box_volume / optimized_box_volume
 
         cost_saved = default_cost - optimized_cost
 
-        sustainability_score = min(100, (co2_saved * 10))
+        # a category box smaller than the chosen one gives negative savings;
+        # the score stays on its 0-100 scale
+        sustainability_score = max(0, min(100, (co2_saved * 10)))
 
         return {
             "weight_saved_kg": round(weight_saved, 4),
             "co2_saved_kg": round(co2_saved, 4),
             "cost_saved": round(cost_saved, 2),
             "sustainability_score": round(sustainability_score, 2)
-        }
\ No newline at end of file
+        }
+
+    def calculate_batch(self, box_volumes, box_costs, box_materials, categories=None):
+        """Vectorized `calculate` over arrays of chosen boxes.
+
+        `categories` may be None or an array of category names; unknown or
+        missing categories fall back to the oversize baseline.  Returns a
+        dict of unrounded arrays.
+        """
+        box_volumes = np.asarray(box_volumes, dtype=np.float64)
+        box_costs = np.asarray(box_costs, dtype=np.float64)
+
+        default_volumes = box_volumes * OVERSIZE_FACTOR
+        if categories is not None and len(self._baseline_volumes):
+            codes = self._baseline_categories.get_indexer(pd.Index(categories))
+            known = codes >= 0
+            default_volumes = np.where(known, self._baseline_volumes[np.where(known, codes, 0)],
+                                       default_volumes)
+
+        materials = pd.Series(box_materials, dtype=object)
+        default_factor = self.co2_factors[DEFAULT_MATERIAL]
+        factors = materials.map(self.co2_factors).fillna(default_factor).to_numpy(dtype=np.float64)
+
+        default_weight = default_volumes * CARDBOARD_DENSITY
+        optimized_weight = box_volumes * CARDBOARD_DENSITY
+        co2_saved = default_weight * default_factor - optimized_weight * factors
+        cost_saved = box_costs * default_volumes / box_volumes - box_costs
+
+        return {
+            "default_box_volume": default_volumes,
+            "weight_saved_kg": default_weight - optimized_weight,
+            "co2_saved_kg": co2_saved,
+            "cost_saved": cost_saved,
+            "sustainability_score": np.clip(co2_saved * 10, 0, 100),
+        }
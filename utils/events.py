@@ -0,0 +1,195 @@
+# utils/events.py
+
+"""In-process change feed for live dashboards.
+
+Write paths in database/db.py publish compact events (a shipment was
+recorded, stock moved, a package was created, scanned or re-graded).
+`EventBroker` fans them out to subscribers, typically one per
+server-sent-events connection.  Publishing never blocks the writer:
+
+* each subscriber has a bounded buffer; a subscriber that falls behind
+  loses its oldest events and is told to resync (refetch) instead;
+* publishing from worker threads wakes each event loop with one
+  `call_soon_threadsafe`, however many subscribers it serves;
+* recent events are kept so a reconnecting client can resume from
+  `Last-Event-ID`.
+
+Events are per process.  Writes made by other worker processes are
+picked up from the shared data-version counters (database/versions.py)
+and announced as `invalidate` events naming the changed domains.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from utils import metrics
+
+
+class Subscriber:
+
+    def __init__(self, loop, buffer_size):
+        self.loop = loop
+        self.queue = deque(maxlen=buffer_size)
+        self.ready = asyncio.Event()
+        self.overflowed = False
+
+
+class EventBroker:
+
+    def __init__(self, buffer_size=256, history_size=1024, poll_interval=1.0):
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        # ids carry a per-process epoch so a client resuming against another
+        # worker or a restarted one is told to resync instead of missing events
+        self.epoch = os.urandom(4).hex()
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=history_size)
+        self._subscribers = {}   # loop -> set of Subscriber
+        self._lock = threading.Lock()
+        self._poller = None
+
+    def event_id(self, seq):
+        return f"{self.epoch}-{seq}"
+
+    def _parse_id(self, event_id):
+        epoch, _, seq = (event_id or "").partition("-")
+        return int(seq) if epoch == self.epoch and seq.isdigit() else None
+
+    def subscribe(self, last_event_id=None):
+        """Register a subscriber on the running loop, replaying what it missed."""
+        loop = asyncio.get_running_loop()
+        sub = Subscriber(loop, self.buffer_size)
+        with self._lock:
+            if last_event_id:
+                last = self._parse_id(last_event_id)
+                oldest = self._history[0][0] if self._history else None
+                latest = self._history[-1][0] if self._history else 0
+                if last is None or last > latest or (oldest is not None and last < oldest - 1):
+                    sub.overflowed = True
+                else:
+                    missed = [e for e in self._history if e[0] > last]
+                    sub.queue.extend(missed)
+                    sub.overflowed = len(missed) > self.buffer_size
+                if sub.queue or sub.overflowed:
+                    sub.ready.set()
+            self._subscribers.setdefault(loop, set()).add(sub)
+        self._start_poller()
+        metrics.inc("events_subscriptions_total")
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.loop)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.loop]
+
+    def drain(self, sub):
+        """A subscriber's buffered events, or one resync event if it lost some."""
+        with self._lock:
+            sub.ready.clear()
+            if sub.overflowed:
+                sub.overflowed = False
+                sub.queue.clear()
+                return [(None, "resync", {})]
+            events = list(sub.queue)
+            sub.queue.clear()
+            return events
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, event_type, data):
+        """Queue an event for every subscriber; safe from any thread."""
+        with self._lock:
+            event = (next(self._ids), event_type, data)
+            self._history.append(event)
+            loops = []
+            for loop, subs in self._subscribers.items():
+                for sub in subs:
+                    if len(sub.queue) == sub.queue.maxlen:
+                        sub.overflowed = True
+                        metrics.inc("events_dropped_total")
+                    sub.queue.append(event)
+                loops.append((loop, list(subs)))
+        metrics.inc("events_published_total", type=event_type)
+        for loop, subs in loops:
+            try:
+                loop.call_soon_threadsafe(_wake, subs)
+            except RuntimeError:
+                # loop closed under a stale subscriber
+                pass
+
+    def _start_poller(self):
+        if self._poller is not None or self.poll_interval <= 0:
+            return
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_versions, daemon=True)
+                self._poller.start()
+
+    def _poll_versions(self):
+        from database import versions
+
+        seen = versions.current(*versions.DOMAINS)
+        local = versions.local_bumps()
+        while True:
+            time.sleep(self.poll_interval)
+            now = versions.current(*versions.DOMAINS)
+            now_local = versions.local_bumps()
+            # changes not explained by this process's own writes
+            foreign = [
+                domain for i, domain in enumerate(versions.DOMAINS)
+                if now[i] - seen[i] > now_local[i] - local[i]
+            ]
+            seen, local = now, now_local
+            if foreign:
+                self.publish("invalidate", {"domains": foreign})
+
+
+def _wake(subs):
+    for sub in subs:
+        sub.ready.set()
+
+
+def format_sse(event_id, event_type, data):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {get_broker().event_id(event_id)}")
+    lines.append(f"event: {event_type}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":"), default=str))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The process-wide broker, configured from the environment on first use."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = EventBroker(
+                    buffer_size=int(os.getenv("EVENTS_BUFFER", 256)),
+                    poll_interval=float(os.getenv("EVENTS_POLL_SECONDS", 1.0)),
+                )
+    return _broker
+
+
+def publish(event_type, data):
+    get_broker().publish(event_type, data)
+
+
+metrics.describe("events_published_total", "Change events published by type.")
+metrics.describe("events_dropped_total", "Events dropped from full subscriber buffers.")
+metrics.describe("events_subscriptions_total", "Event stream subscriptions opened.")
+metrics.register_gauge("events_subscribers", lambda: get_broker().subscriber_count())
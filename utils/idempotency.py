@@ -0,0 +1,103 @@
+# utils/idempotency.py
+
+"""Idempotency keys with single-flight execution.
+
+Clients that retry send the same `Idempotency-Key` with each attempt.  The
+first request with a key runs; concurrent duplicates block until it
+finishes and receive its response (or, past a short wait, a timeout the
+API turns into 409); later duplicates get the stored response until it
+expires.  The store is bounded and per process.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from utils import metrics
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used with a different request body."""
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "response", "expires")
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.response = None
+        self.expires = None
+
+
+class IdempotencyStore:
+
+    def __init__(self, max_entries=10000, ttl_seconds=24 * 3600, wait_timeout=5.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.wait_timeout = wait_timeout
+        self._entries = {}
+        # finished entries in completion order; with one ttl that is also
+        # expiry order, so eviction only ever looks at the front
+        self._finished = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _drop_oldest(self):
+        key, entry = self._finished.popitem(last=False)
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def _evict(self, now):
+        # drop expired entries, then the oldest finished ones over capacity;
+        # in-flight entries are never evicted
+        while self._finished and next(iter(self._finished.values())).expires <= now:
+            self._drop_oldest()
+        while len(self._entries) > self.max_entries and self._finished:
+            self._drop_oldest()
+
+    def run(self, key, fingerprint, fn):
+        """Run `fn()` once per key; returns (response, replayed)."""
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires is not None and entry.expires <= now:
+                    del self._entries[key]
+                    entry = None
+                if entry is None:
+                    entry = self._entries[key] = _Entry(fingerprint)
+                    self._evict(now)
+                    leader = True
+                else:
+                    leader = False
+            if entry.fingerprint != fingerprint:
+                metrics.inc("idempotency_requests_total", result="conflict")
+                raise IdempotencyConflict(key)
+
+            if leader:
+                try:
+                    response = fn()
+                except Exception:
+                    # failures are not remembered; a waiting duplicate retries
+                    with self._lock:
+                        self._entries.pop(key, None)
+                    entry.done.set()
+                    raise
+                entry.response = response
+                with self._lock:
+                    entry.expires = time.monotonic() + self.ttl_seconds
+                    self._finished.pop(key, None)
+                    self._finished[key] = entry
+                entry.done.set()
+                metrics.inc("idempotency_requests_total", result="executed")
+                return response, False
+
+            if not entry.done.wait(self.wait_timeout):
+                raise TimeoutError(f"request with idempotency key {key!r} still in progress")
+            if entry.expires is not None:
+                metrics.inc("idempotency_requests_total", result="replayed")
+                return entry.response, True
+            # the leader failed; loop and try to become the new leader
+
+
+metrics.describe("idempotency_requests_total", "Idempotency-keyed requests by outcome.")
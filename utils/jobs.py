@@ -0,0 +1,81 @@
+# utils/jobs.py
+
+"""Background jobs for long admin operations.
+
+Catalog simulation and rationalization can run for minutes.  Their
+endpoints submit the work to a `JobRunner` and return a job id at once;
+clients poll for the result.  Each runner allows one job at a time, so
+repeated submissions cannot pile up replays on the same worker, and keeps
+the last few finished jobs.  Jobs are per process.
+"""
+
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from utils import metrics
+
+
+class JobBusy(Exception):
+    """A job of this kind is already running; `job_id` names it."""
+
+    def __init__(self, job_id):
+        super().__init__(job_id)
+        self.job_id = job_id
+
+
+class JobRunner:
+
+    def __init__(self, kind, history=16):
+        self.kind = kind
+        self.history = history
+        self._jobs = OrderedDict()
+        self._running = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn):
+        """Start `fn()` in a background thread; returns the new job's status."""
+        with self._lock:
+            if self._running is not None:
+                raise JobBusy(self._running)
+            job_id = uuid.uuid4().hex
+            self._running = job_id
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "kind": self.kind,
+                "status": "running",
+                "submitted_at": time.time(),
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+            job = dict(self._jobs[job_id])
+        threading.Thread(
+            target=self._run, args=(job_id, fn), daemon=True, name=f"{self.kind}-job"
+        ).start()
+        return job
+
+    def _run(self, job_id, fn):
+        try:
+            update = {"status": "done", "result": fn()}
+        except Exception as e:
+            traceback.print_exc()
+            update = {"status": "failed", "error": str(e) or type(e).__name__}
+        metrics.inc("jobs_total", kind=self.kind, status=update["status"])
+        with self._lock:
+            self._running = None
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(update, finished_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+
+metrics.describe("jobs_total", "Background jobs finished, by kind and status.")
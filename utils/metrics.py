@@ -0,0 +1,203 @@
+# utils/metrics.py
+
+"""Lightweight in-process metrics with Prometheus text exposition.
+
+Everything here is designed to stay on in production: recording a sample is
+a dict lookup, a bisect and a couple of additions under a lock.  There is no
+external dependency; `render()` produces the text format scraped from
+`/metrics`.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# latency buckets in seconds, roughly log-spaced from 0.5ms to 10s
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# buckets for small integer counts (db calls per request)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_help = {}
+
+# number of db calls made while serving the current request; None outside
+# of a request so background jobs don't accumulate anything
+_request_db_calls = contextvars.ContextVar("request_db_calls", default=None)
+
+
+def _key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def describe(name, text):
+    """Attach a HELP line to a metric family."""
+    _help[name] = text
+
+
+def inc(name, value=1, **labels):
+    """Increment a counter."""
+    key = (name, _key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Record a sample in a histogram."""
+    key = (name, _key(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = _Histogram(buckets)
+        hist.observe(value)
+
+
+def register_gauge(name, callback, **labels):
+    """Register a callable evaluated at scrape time (e.g. pool sizes)."""
+    _gauges[(name, _key(labels))] = callback
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup; hit rate is hits / (hits + misses)."""
+    inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def timed(stage):
+    """Time a block of work and record it under `stage_duration_seconds`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("stage_duration_seconds", time.perf_counter() - start, stage=stage)
+
+
+def instrument_db(func):
+    """Decorator for database functions: latency, call and error counts."""
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        calls = _request_db_calls.get()
+        if calls is not None:
+            calls[0] += 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            inc("db_errors_total", function=name)
+            raise
+        finally:
+            observe("db_call_duration_seconds", time.perf_counter() - start, function=name)
+
+    return wrapper
+
+
+def begin_request():
+    """Start counting db calls for the current request context."""
+    return _request_db_calls.set([0])
+
+
+def end_request(token, route, method, status, elapsed):
+    """Record latency and db call count for a finished request."""
+    calls = _request_db_calls.get()
+    _request_db_calls.reset(token)
+    observe("http_request_duration_seconds", elapsed, route=route, method=method)
+    inc("http_requests_total", route=route, method=method, status=str(status))
+    if calls is not None:
+        observe("db_calls_per_request", calls[0], buckets=COUNT_BUCKETS, route=route)
+
+
+def _fmt_labels(labels, extra=None):
+    items = list(labels)
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                    for k, v in items)
+    return "{" + body + "}"
+
+
+def _fmt_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: (h.buckets, list(h.counts), h.total, h.count)
+                      for k, h in _histograms.items()}
+
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name in seen:
+            return
+        seen.add(name)
+        if name in _help:
+            lines.append("# HELP %s %s" % (name, _help[name]))
+        lines.append("# TYPE %s %s" % (name, kind))
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter")
+        lines.append("%s%s %s" % (name, _fmt_labels(labels), _fmt_value(value)))
+
+    for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+        header(name, "histogram")
+        cumulative = 0
+        for bound, n in zip(buckets, counts):
+            cumulative += n
+            lines.append("%s_bucket%s %d" % (name, _fmt_labels(labels, ("le", _fmt_value(bound))), cumulative))
+        lines.append("%s_bucket%s %d" % (name, _fmt_labels(labels, ("le", "+Inf")), count))
+        lines.append("%s_sum%s %s" % (name, _fmt_labels(labels), repr(total)))
+        lines.append("%s_count%s %d" % (name, _fmt_labels(labels), count))
+
+    for (name, labels), callback in sorted(_gauges.items(), key=lambda kv: kv[0]):
+        try:
+            value = callback()
+        except Exception:
+            continue
+        if value is None:
+            continue
+        header(name, "gauge")
+        lines.append("%s%s %s" % (name, _fmt_labels(labels), _fmt_value(value)))
+
+    return "\n".join(lines) + "\n"
+
+
+describe("http_request_duration_seconds", "Request latency by route.")
+describe("http_requests_total", "Requests served by route and status.")
+describe("db_calls_per_request", "Database calls issued while serving a request.")
+describe("db_call_duration_seconds", "Latency of database/db.py functions.")
+describe("db_errors_total", "Exceptions raised by database/db.py functions.")
+describe("stage_duration_seconds", "Latency of instrumented hot-path stages.")
+describe("cache_requests_total", "Cache lookups by cache and result.")
+describe("db_connections_opened_total", "Database connections opened.")
@@ -0,0 +1,290 @@
+# utils/profiling.py
+
+"""Opt-in, on-demand profiling for the backend.
+
+Profiling is disabled unless `PROFILER_TOKEN` is set.  A capture is armed
+either through the admin endpoints (N requests and/or a time window) or per
+request by sending the token in an `X-Profile` header.  Two kinds of
+capture are supported:
+
+* ``cprofile`` - deterministic cProfile of the decorated endpoints, merged
+  into one pstats file.  Optionally records a tracemalloc allocation diff
+  per profiled request.
+* ``sample`` - a background thread samples every worker thread's stack at a
+  fixed interval and produces flamegraph-compatible collapsed stacks.
+"""
+
+import cProfile
+import contextvars
+import hmac
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from functools import wraps
+
+# frames whose leaf is one of these files are idle waits, not work
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "thread.py")
+_MAX_ALLOCATION_SUMMARIES = 50
+
+_lock = threading.Lock()
+_session = None
+
+# set by the request middleware when a valid X-Profile header is present
+_profile_this_request = contextvars.ContextVar("profile_this_request", default=False)
+
+
+def _token():
+    return os.getenv("PROFILER_TOKEN")
+
+
+def enabled():
+    return bool(_token())
+
+
+def check_token(value):
+    """Constant-time comparison against the configured token."""
+    token = _token()
+    return bool(token and value and hmac.compare_digest(token, value))
+
+
+def mark_request(header_value):
+    """Flag the current request for profiling if it carries a valid token."""
+    if header_value and check_token(header_value):
+        _profile_this_request.set(True)
+
+
+class _Session:
+
+    def __init__(self, mode, requests, seconds, allocations):
+        self.mode = mode
+        self.remaining = requests
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.allocations = allocations
+        self.started_at = time.time()
+        self.profiled = 0
+        self.stats = None
+        self.samples = Counter()
+        self.allocation_summaries = []
+        self.sampler = None
+        # tracemalloc slows every allocation; stop it with the capture
+        # unless someone else had it running already
+        self.owns_tracing = False
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.owns_tracing = True
+
+    def active(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return False
+        if self.mode == "cprofile" and self.deadline is None:
+            return self.remaining > 0
+        return True
+
+    def finish(self):
+        """End the capture: stop the sampler and any tracing it started."""
+        if self.deadline is None or self.deadline > time.monotonic():
+            self.deadline = time.monotonic()
+        if self.sampler is not None and self.sampler is not threading.current_thread():
+            self.sampler.join()
+        with _lock:
+            owns, self.owns_tracing = self.owns_tracing, False
+        if owns:
+            tracemalloc.stop()
+
+    def status(self):
+        return {
+            "mode": self.mode,
+            "active": self.active(),
+            "profiled_requests": self.profiled,
+            "remaining_requests": self.remaining if self.deadline is None else None,
+            "seconds_left": (
+                max(0.0, round(self.deadline - time.monotonic(), 1))
+                if self.deadline is not None else None
+            ),
+            "allocations": self.allocations,
+            "samples": sum(self.samples.values()),
+        }
+
+
+def start(mode="cprofile", requests=10, seconds=0, allocations=False, interval=0.005):
+    """Arm a new capture, replacing any previous one."""
+    global _session
+    if mode not in ("cprofile", "sample"):
+        raise ValueError("mode must be 'cprofile' or 'sample'")
+    if mode == "sample" and not seconds:
+        raise ValueError("sampling captures need a time window (seconds)")
+    with _lock:
+        previous, _session = _session, None
+    if previous is not None:
+        previous.finish()
+    session = _Session(mode, requests, seconds, allocations)
+    with _lock:
+        _session = session
+    if mode == "sample":
+        session.sampler = threading.Thread(
+            target=_sample_loop, args=(session, interval), daemon=True, name="profiler-sampler"
+        )
+        session.sampler.start()
+    return session.status()
+
+
+def stop():
+    """End the current capture early; its results stay available for export."""
+    with _lock:
+        session = _session
+    if session is not None:
+        session.finish()
+    return session.status() if session is not None else {"active": False}
+
+
+def status():
+    with _lock:
+        session = _session
+    return session.status() if session is not None else {"active": False}
+
+
+def _claim():
+    """Return the session if the current call should be profiled."""
+    global _session
+    with _lock:
+        session = _session
+        if _profile_this_request.get():
+            # header-triggered profiles accumulate into a cprofile capture,
+            # starting one if none is armed.  A sampling capture is never
+            # replaced while its sampler runs: the header is ignored instead
+            if session is not None and session.mode != "cprofile":
+                if session.sampler is not None and session.sampler.is_alive():
+                    return None
+                session = None
+            if session is None:
+                session = _session = _Session("cprofile", 0, 0, False)
+            return session
+        if session is None or session.mode != "cprofile":
+            return None
+        if not session.active():
+            return None
+        if session.deadline is None:
+            session.remaining -= 1
+        return session
+
+
+def profiled(func):
+    """Endpoint decorator: profile the call when a capture wants it.
+
+    The wrapper runs in the same worker thread as the endpoint body, which
+    is what cProfile needs to see the pandas work of sync endpoints.
+    """
+    label = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        wanted = _session is not None or _profile_this_request.get()
+        session = _claim() if wanted else None
+        if session is None:
+            return func(*args, **kwargs)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is active (concurrent capture on 3.12+)
+            return func(*args, **kwargs)
+        before = tracemalloc.take_snapshot() if session.allocations and tracemalloc.is_tracing() else None
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            try:
+                after = tracemalloc.take_snapshot() if before is not None else None
+            except RuntimeError:
+                # the capture ended and stopped tracing meanwhile
+                after = None
+            with _lock:
+                session.profiled += 1
+                if session.stats is None:
+                    session.stats = pstats.Stats(profiler)
+                else:
+                    session.stats.add(profiler)
+                if after is not None and len(session.allocation_summaries) < _MAX_ALLOCATION_SUMMARIES:
+                    session.allocation_summaries.append(_allocation_summary(label, before, after))
+                done = not session.active()
+            if done and session.owns_tracing:
+                session.finish()
+
+    return wrapper
+
+
+def _allocation_summary(label, before, after, limit=15):
+    # snapshots are process-wide, so concurrent requests show up as well
+    diff = after.compare_to(before, "lineno")
+    top = [
+        {
+            "location": "%s:%d" % (stat.traceback[0].filename, stat.traceback[0].lineno),
+            "size_diff_kb": round(stat.size_diff / 1024, 1),
+            "count_diff": stat.count_diff,
+        }
+        for stat in diff[:limit]
+    ]
+    return {
+        "endpoint": label,
+        "net_kb": round(sum(s.size_diff for s in diff) / 1024, 1),
+        "top": top,
+    }
+
+
+def _collapse(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def _sample_loop(session, interval):
+    me = threading.get_ident()
+    while session.active():
+        for ident, frame in sys._current_frames().items():
+            if ident == me or frame is None:
+                continue
+            if os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            session.samples[_collapse(frame)] += 1
+        time.sleep(interval)
+
+
+def allocations():
+    with _lock:
+        session = _session
+    return list(session.allocation_summaries) if session is not None else []
+
+
+def export():
+    """Return (payload bytes, filename, media type) for the last capture."""
+    with _lock:
+        session = _session
+    if session is None:
+        return None
+    session.finish()
+    if session.mode == "sample":
+        lines = ["%s %d" % (stack, n) for stack, n in session.samples.most_common()]
+        return ("\n".join(lines) + "\n").encode(), "profile.collapsed", "text/plain"
+
+    if session.stats is None:
+        return None
+    # pstats can only serialize to a path
+    fd, path = tempfile.mkstemp(suffix=".pstats")
+    os.close(fd)
+    try:
+        with _lock:
+            session.stats.dump_stats(path)
+        with open(path, "rb") as fh:
+            data = fh.read()
+    finally:
+        os.unlink(path)
+    return data, "profile.pstats", "application/octet-stream"
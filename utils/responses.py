@@ -0,0 +1,186 @@
+# utils/responses.py
+
+"""Fast JSON responses, response compression and columnar payloads.
+
+FastAPI passes a plain return value through `jsonable_encoder`, which
+walks the whole structure in Python, and then `json.dumps` walks it again.
+Endpoints with large payloads return a `FastJSONResponse` instead, which
+serializes once with orjson (NumPy arrays and scalars, datetimes and NaN
+handled natively).  orjson and brotli are required; the stdlib encoder
+with a NumPy-aware fallback, and gzip-only compression, remain for
+environments where they cannot be installed.
+"""
+
+import gzip
+import json
+import math
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # fallback only; requirements.txt pins it
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # fallback only (gzip); requirements.txt pins it
+    brotli = None
+
+# ?format= values accepted by endpoints that return tables
+ROW_FORMATS = ("records", "columns")
+
+
+def _default(obj):
+    """Encode types neither serializer knows about."""
+    if isinstance(obj, np.generic):
+        value = obj.item()
+        return None if isinstance(value, float) and math.isnan(value) else value
+    if isinstance(obj, np.ndarray):
+        return _default_list(obj.tolist())
+    if isinstance(obj, (datetime, date)):  # includes pd.Timestamp
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _default_list(values):
+    return [None if isinstance(v, float) and math.isnan(v) else v for v in values]
+
+
+def dumps(content):
+    if orjson is not None:
+        return orjson.dumps(
+            content, default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by `dumps`; return it to skip jsonable_encoder."""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def frame_records(frame):
+    """DataFrame rows as dicts of plain Python values, NaN as None."""
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+
+
+def frame_columns(frame):
+    """DataFrame as {column: values}; NumPy arrays go straight to orjson."""
+    columns = {}
+    for name in frame.columns:
+        series = frame[name]
+        if orjson is not None and series.dtype.kind in "biuf":
+            columns[name] = series.to_numpy()
+        elif series.dtype.kind == "M":
+            columns[name] = [None if pd.isna(t) else t.isoformat() for t in series]
+        else:
+            columns[name] = series.astype(object).where(series.notna(), None).tolist()
+    return columns
+
+
+def rows_columns(rows):
+    """List of row dicts (as the db layer returns them) as {column: values}."""
+    if not rows:
+        return {}
+    return {name: [row.get(name) for row in rows] for name in rows[0]}
+
+
+def choose_encoding(accept_encoding):
+    """Pick br or gzip from an Accept-Encoding header, honouring q-values."""
+    best, best_q = None, 0.0
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        if name == "br" and brotli is None:
+            continue
+        # on equal weight prefer br: smaller output for JSON
+        if name in ("br", "gzip") and (q > best_q or (q == best_q and name == "br")):
+            best, best_q = name, q
+    return best
+
+
+def _compressible(content_type):
+    content_type = content_type.split(";", 1)[0].strip().lower()
+    if content_type == "text/event-stream":
+        return False
+    return content_type.startswith("text/") or content_type.endswith(("json", "javascript", "xml"))
+
+
+class CompressionMiddleware:
+    """gzip/br compression of complete responses, negotiated per request.
+
+    Only single-message bodies are compressed; streamed responses such as
+    server-sent events pass through untouched, so nothing is held back.
+    """
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not _compressible(headers.get("content-type", "")):
+                    await send(message)
+                    return
+                # held until the first body message shows whether it streams
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            held, start = start, None
+            headers = MutableHeaders(raw=held["headers"])
+            body = message.get("body", b"")
+            if message.get("more_body"):
+                await send(held)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) >= self.minimum_size:
+                if encoding == "br":
+                    body = brotli.compress(body, quality=self.brotli_quality)
+                else:
+                    body = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            await send(held)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)